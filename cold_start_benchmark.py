@@ -0,0 +1,116 @@
+import argparse
+import os
+import shlex
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import requests
+
+# Cold-start time of the web app: from (re)starting it to the first served
+# request on / and to the first successful /ready (pools connected).
+#
+# Local gunicorn (the app's dependencies reachable via the usual env vars):
+#   python cold_start_benchmark.py --runs 5
+#
+# A container, timing from `docker start`/restart:
+#   python cold_start_benchmark.py --url http://localhost:5000 \
+#       --start "docker compose restart web" --runs 5
+#   python cold_start_benchmark.py --url http://localhost:5000 \
+#       --start "docker service update --force tracker_stack_flask" --runs 3
+#
+# With --phases, the import and create_app() times are also measured in a
+# fresh interpreter, which is what every worker (re)start pays before it serves.
+
+FLASK_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flask_app")
+
+PHASES_SCRIPT = """
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(f"{(imported - started) * 1000:.1f} {(created - imported) * 1000:.1f}")
+"""
+
+def wait_for(url, accept, deadline):
+    """Poll url until accept(status) is true. Returns the time it happened, or None."""
+    while time.monotonic() < deadline:
+        try:
+            if accept(requests.get(url, timeout=1).status_code):
+                return time.monotonic()
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    return None
+
+def measure(args):
+    started = time.monotonic()
+    process = None
+    if args.start:
+        subprocess.run(shlex.split(args.start), check=True)
+    else:
+        process = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"], cwd=FLASK_APP_DIR,
+                                   env=dict(os.environ, PORT=str(args.port)), start_new_session=True,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = started + args.timeout
+    try:
+        # Any HTTP answer on / (a 429 is served too) is the first served request
+        first = wait_for(f"{args.url}/", lambda status: True, deadline)
+        ready = wait_for(f"{args.url}/ready", lambda status: status == 200, deadline)
+    finally:
+        if process:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=30)
+
+    return (first - started if first else None), (ready - started if ready else None)
+
+def phases():
+    output = subprocess.run([sys.executable, "-c", PHASES_SCRIPT], cwd=FLASK_APP_DIR,
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[-2]), float(output[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="App URL (default: the local gunicorn on --port).")
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--start", help="Command that (re)starts the app; default: start gunicorn locally.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--phases", action="store_true", help="Also time import and create_app().")
+    args = parser.parse_args()
+    if args.start and not args.url:
+        parser.error("--start needs --url")
+    args.url = args.url or f"http://127.0.0.1:{args.port}"
+
+    if args.phases:
+        timings = [phases() for _ in range(args.runs)]
+        print(f"import app:   {statistics.median(t[0] for t in timings):8.1f} ms (median of {args.runs})")
+        print(f"create_app(): {statistics.median(t[1] for t in timings):8.1f} ms")
+
+    firsts, readies = [], []
+    for run in range(1, args.runs + 1):
+        first, ready = measure(args)
+        print(f"run {run}: first response {first if first is None else f'{first:.2f}s'}, "
+              f"ready {ready if ready is None else f'{ready:.2f}s'}")
+        if first is not None:
+            firsts.append(first)
+        if ready is not None:
+            readies.append(ready)
+        if args.start:
+            # Let the restarted app settle before restarting it again
+            time.sleep(2)
+
+    if firsts:
+        print(f"\nfirst served request: median {statistics.median(firsts):.2f}s, max {max(firsts):.2f}s")
+    if readies:
+        print(f"ready:                median {statistics.median(readies):.2f}s, max {max(readies):.2f}s")
+    if len(readies) < args.runs:
+        print(f"{args.runs - len(readies)} run(s) did not become ready within {args.timeout:.0f}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
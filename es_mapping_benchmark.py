@@ -0,0 +1,113 @@
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import time
+from elasticsearch import Elasticsearch, helpers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "flask_app"))
+from services.elastic_service import TORRENTS_INDEX_SETTINGS, TORRENTS_MAPPINGS, build_search_query
+
+# Compares the explicit torrents mapping with the dynamic mapping the index
+# used to get: index size after a force merge and query latency for the kinds
+# of searches users run. Both indices get the same synthetic catalog.
+#
+#   python es_mapping_benchmark.py --url http://localhost:9200 --docs 200000
+
+DYNAMIC_INDEX = "bench_dynamic"
+MAPPED_INDEX = "bench_mapped"
+
+SHOWS = ["Some Show", "The Expanse", "Night Watch", "Blue Planet", "Silent Harbor", "Dark Matter",
+         "Lost Signal", "Iron Valley", "Paper Moon", "Cold Front"]
+TAGS = ["1080p", "720p", "2160p", "WEB-DL", "BluRay", "x264", "x265", "HDR", "AAC", "DDP5.1"]
+
+def release_name(rng):
+    show = rng.choice(SHOWS).replace(" ", rng.choice([".", " ", "_"]))
+    episode = f"S{rng.randint(1, 12):02d}E{rng.randint(1, 24):02d}"
+    return ".".join([show, episode] + rng.sample(TAGS, 3)) + "-" + rng.choice(["GRP", "NTb", "FLUX", "RARBG"])
+
+def documents(count, seed=1):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        name = release_name(rng)
+        yield {
+            "id": i,
+            "info_hash": hashlib.sha1(str(i).encode()).hexdigest(),
+            "filename": name,
+            "description": f"{name.replace('.', ' ')} uploaded by user {rng.randint(1, 500)}",
+            "file_size": rng.randint(100_000_000, 20_000_000_000),
+            "piece_length": 262144,
+            "seeders": rng.randint(0, 5000),
+            "leechers": rng.randint(0, 500),
+            "completed": rng.randint(0, 100000),
+            "uploader_id": rng.randint(1, 500),
+            "created_at": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00",
+            "updated_at": "2024-12-31T12:00:00"
+        }
+
+def legacy_query(query):
+    # The query the app ran before the explicit mapping
+    return {"multi_match": {"query": query, "fields": ["filename^3", "description^2", "info_hash"], "fuzziness": "AUTO"}}
+
+def load(es, index, body, count):
+    es.indices.delete(index=index, ignore_unavailable=True)
+    es.indices.create(index=index, **body)
+    actions = ({"_index": index, "_id": doc["id"], "_source": doc} for doc in documents(count))
+    helpers.bulk(es, actions, chunk_size=2000)
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1)
+    return es.indices.stats(index=index, metric="store")["indices"][index]["primaries"]["store"]["size_in_bytes"]
+
+def time_queries(es, index, build, queries, repeat):
+    latencies = []
+    hits = 0
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            response = es.search(index=index, query=build(query), size=50, request_cache=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += response["hits"]["total"]["value"]
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "hits": hits // repeat
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200"))
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark indices.")
+    args = parser.parse_args()
+
+    es = Elasticsearch([args.url], request_timeout=300)
+
+    sizes = {
+        DYNAMIC_INDEX: load(es, DYNAMIC_INDEX, {}, args.docs),
+        MAPPED_INDEX: load(es, MAPPED_INDEX, {"settings": TORRENTS_INDEX_SETTINGS, "mappings": TORRENTS_MAPPINGS}, args.docs)
+    }
+    for index, size in sizes.items():
+        print(f"{index}: {size / 1024 / 1024:.1f} MiB for {args.docs} documents")
+
+    query_sets = {
+        "words": ["expanse", "night watch", "planet", "silent harbor"],
+        "release tokens": ["S01E02", "1080p", "x265", "WEB-DL"],
+        "partial words": ["expa", "harb", "plan"],
+        "info_hash": [hashlib.sha1(str(i).encode()).hexdigest() for i in (1, args.docs // 2, args.docs)]
+    }
+
+    print(f"\n{'queries':<16}{'index':<16}{'p50 ms':>10}{'p99 ms':>10}{'hits':>10}")
+    for name, queries in query_sets.items():
+        for index, build in ((DYNAMIC_INDEX, legacy_query), (MAPPED_INDEX, build_search_query)):
+            result = time_queries(es, index, build, queries, args.repeat)
+            print(f"{name:<16}{index:<16}{result['p50']:>10.2f}{result['p99']:>10.2f}{result['hits']:>10}")
+
+    if not args.keep:
+        es.indices.delete(index=f"{DYNAMIC_INDEX},{MAPPED_INDEX}", ignore_unavailable=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,33 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from database import db
 from config import Config
 from routes.auth_routes import auth_bp
 from routes.torrent_routes import torrent_bp
+from routes.tracker_routes import tracker_bp
+from routes.health_routes import health_bp
+from services.pool_metrics_service import publish_pool_metrics
+from commands import register_commands
 
 def create_app():
     app = Flask(__name__)
 
     app.config.from_object(Config)
 
+    if Config.TRUSTED_PROXY_COUNT:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_COUNT, x_proto=Config.TRUSTED_PROXY_COUNT)
+
     db.init_app(app)
+    app.teardown_appcontext(publish_pool_metrics)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(torrent_bp)
+    app.register_blueprint(tracker_bp)
+    app.register_blueprint(health_bp)
 
-    with app.app_context():
-        db.create_all()
+    # Nothing here touches Postgres, Redis, Elasticsearch or Keycloak: clients
+    # connect on first use and the schema is set up by `flask migrate`
+    register_commands(app)
 
     return app
 
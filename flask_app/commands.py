@@ -0,0 +1,264 @@
+import click
+import os
+import time
+from datetime import datetime
+from sqlalchemy import update
+from models import Torrent, db
+from services.swarm_service import (
+    get_swarm_counts, pop_dirty_info_hashes, mark_dirty, register_torrents, start_sync, record_sync
+)
+from services.search_outbox_service import enqueue_updates, drain_outbox, outbox_paused
+from services.reindex_service import reindex_torrents, abort_reindex, ReindexError
+from services.elastic_service import ensure_search_index
+from migrations import run_migrations
+from services.ingest_service import ingest_torrents, iter_archive, TAR_SUFFIXES
+from services.torrent_service import invalidate_torrent_details, details_version
+from services.redis_service import set_rate_limit_override, remove_rate_limit_override, get_rate_limit_overrides
+from config import Config
+
+def sync_swarm_counts(batch_size: int = 1000):
+    """
+    Copy the live swarm counts of every torrent that changed since the last run
+    into the Torrent.seeders/leechers/completed columns (and Elasticsearch).
+
+    The dirty set coalesces any number of announces into one write per torrent;
+    torrents whose counts ended up where they started (a peer joined and left,
+    expired peers replaced by new ones) are skipped entirely.
+
+    Returns:
+        dict with buffered, updated and unchanged torrent counts and the
+        flush time in seconds
+    """
+    started = time.monotonic()
+    buffered, changes = start_sync()
+    updated = 0
+    unchanged = 0
+
+    while True:
+        info_hashes = pop_dirty_info_hashes(batch_size)
+        if not info_hashes:
+            break
+
+        try:
+            counts = get_swarm_counts(info_hashes)
+            rows = db.session.query(
+                Torrent.id, Torrent.info_hash, Torrent.seeders, Torrent.leechers, Torrent.completed
+            ).filter(
+                Torrent.info_hash.in_([ih.hex() for ih in info_hashes])
+            ).all()
+
+            now = datetime.utcnow()
+            changed = []
+            for torrent_id, info_hash, seeders, leechers, completed in rows:
+                live = counts.get(bytes.fromhex(info_hash))
+                if live is None or live == (seeders, leechers, completed):
+                    unchanged += 1
+                    continue
+
+                complete, incomplete, downloaded = live
+                changed.append({
+                    "id": torrent_id,
+                    "seeders": complete,
+                    "leechers": incomplete,
+                    "completed": downloaded,
+                    "updated_at": now
+                })
+
+            if changed:
+                db.session.execute(update(Torrent), changed)
+                enqueue_updates({change["id"]: {
+                    "seeders": change["seeders"],
+                    "leechers": change["leechers"],
+                    "completed": change["completed"],
+                    # Merged into the existing suggest object, keeping its input
+                    "suggest": {"weight": change["seeders"]}
+                } for change in changed})
+            db.session.commit()
+            if changed:
+                invalidate_torrent_details([change["id"] for change in changed], details_version(now))
+        except Exception:
+            db.session.rollback()
+            # Put them back so the next run retries
+            mark_dirty(info_hashes)
+            raise
+
+        updated += len(changed)
+
+    seconds = time.monotonic() - started
+    record_sync(buffered, changes, updated, unchanged, seconds)
+    return {"buffered": buffered, "updated": updated, "unchanged": unchanged, "seconds": seconds}
+
+def setup_search_index(timeout: float, log=print, retry_interval: float = 5.0):
+    """
+    Run ensure_search_index, retrying while Elasticsearch is unreachable.
+
+    Returns:
+        True once the index is set up, False if it still failed after `timeout`
+        seconds (a negative timeout retries forever)
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            ensure_search_index()
+            return True
+        except Exception as e:
+            if timeout >= 0 and time.monotonic() + retry_interval > deadline:
+                log(f"Could not set up the search index: {e}")
+                return False
+            log(f"Search index setup failed ({e}), retrying in {retry_interval:.0f}s")
+            time.sleep(retry_interval)
+
+def register_commands(app):
+    @app.cli.command("sync-swarm")
+    @click.option("--interval", type=int, default=Config.TRACKER_SYNC_INTERVAL,
+                  help="Seconds between syncs.")
+    @click.option("--once", is_flag=True, help="Sync once and exit.")
+    def sync_swarm(interval, once):
+        """Derive the Torrent swarm columns from the tracker's swarm store."""
+        while True:
+            result = sync_swarm_counts()
+            click.echo(
+                f"Synced swarm counts for {result['updated']} of {result['buffered']} buffered torrent(s) "
+                f"({result['unchanged']} unchanged) in {result['seconds']:.2f}s"
+            )
+
+            if once:
+                return
+            time.sleep(interval)
+
+    @app.cli.command("search-worker")
+    @click.option("--batch-size", type=int, default=Config.SEARCH_OUTBOX_BATCH_SIZE)
+    @click.option("--poll-interval", type=float, default=Config.SEARCH_OUTBOX_POLL_INTERVAL,
+                  help="Seconds to sleep when the queue is empty.")
+    @click.option("--once", is_flag=True, help="Drain the queue once and exit.")
+    def search_worker(batch_size, poll_interval, once):
+        """Apply queued search index writes to Elasticsearch in bulk."""
+        # Writing to a cluster without the template and alias would create a
+        # dynamically mapped index
+        setup_search_index(-1, log=lambda message: click.echo(message, err=True))
+
+        paused = None
+        while True:
+            try:
+                applied, failed = drain_outbox(batch_size)
+            except Exception as e:
+                db.session.rollback()
+                click.echo(f"Search outbox drain failed: {e}", err=True)
+                applied, failed = 0, 0
+
+            if applied or failed:
+                click.echo(f"Applied {applied} torrent(s), {failed} failed (will retry)")
+            elif once:
+                return
+            else:
+                # Logged when the pause starts and ends, not on every poll
+                reason = outbox_paused()
+                if reason != paused:
+                    click.echo(f"Paused ({reason}), writes stay queued" if reason else "Resumed")
+                    paused = reason
+
+            if not applied:
+                time.sleep(poll_interval)
+
+    @app.cli.command("reindex")
+    @click.option("--batch-size", type=int, default=Config.SEARCH_REINDEX_BATCH_SIZE,
+                  help="Rows per cursor fetch and per bulk request.")
+    @click.option("--threads", type=int, default=Config.SEARCH_REINDEX_THREADS,
+                  help="Bulk requests in flight.")
+    @click.option("--restart", is_flag=True, help="Discard an interrupted reindex and start over.")
+    @click.option("--abort", is_flag=True, help="Discard an interrupted reindex and exit.")
+    @click.option("--keep-old", is_flag=True, help="Keep the previous index after the alias swap.")
+    def reindex(batch_size, threads, restart, abort, keep_old):
+        """Rebuild the search index from Postgres and swap it in atomically (resumable)."""
+        if abort:
+            abort_reindex(log=click.echo)
+            return
+
+        try:
+            reindex_torrents(batch_size, threads, restart=restart, keep_old=keep_old, log=click.echo)
+        except ReindexError as e:
+            raise click.ClickException(str(e))
+
+    @app.cli.command("register-torrents")
+    @click.option("--batch-size", type=int, default=5000)
+    def register_all_torrents(batch_size):
+        """Allow announces for every torrent already in the database."""
+        registered = 0
+        batch = []
+        for (info_hash,) in db.session.query(Torrent.info_hash).yield_per(batch_size):
+            batch.append(bytes.fromhex(info_hash))
+            if len(batch) >= batch_size:
+                register_torrents(batch)
+                registered += len(batch)
+                batch = []
+
+        register_torrents(batch)
+        registered += len(batch)
+        click.echo(f"Registered {registered} torrent(s) with the tracker")
+
+    @app.cli.command("migrate")
+    @click.option("--batch-size", type=int, default=1000, help="Rows per transaction for data migrations.")
+    @click.option("--search-timeout", type=int, default=Config.SEARCH_SETUP_TIMEOUT,
+                  help="Seconds to wait for Elasticsearch before failing.")
+    def migrate(batch_size, search_timeout):
+        """Create or update the database schema (resumable) and the search index template."""
+        run_migrations(batch_size, log=click.echo)
+
+        if not setup_search_index(search_timeout, log=lambda message: click.echo(message, err=True)):
+            raise click.ClickException("Elasticsearch did not come up; run `flask migrate` again")
+
+    @app.cli.command("rate-limit")
+    @click.option("--bucket", default="default", help="Rate limit bucket (\"default\" unless the route names one).")
+    @click.option("--client", help="Override for one client only.")
+    @click.option("--set", "value", metavar="LIMIT/WINDOW", help="Allow LIMIT requests per WINDOW seconds.")
+    @click.option("--remove", is_flag=True, help="Go back to the limit set in the code.")
+    def rate_limit_override(bucket, client, value, remove):
+        """Override rate limits at runtime; lists the overrides without --set/--remove."""
+        if value:
+            try:
+                limit, window = (int(part) for part in value.split("/"))
+            except ValueError:
+                raise click.BadParameter("expected LIMIT/WINDOW, e.g. 100/60", param_hint="--set")
+            if limit < 1 or window < 1:
+                raise click.BadParameter("limit and window must be positive", param_hint="--set")
+            set_rate_limit_override(bucket, limit, window, client)
+        elif remove:
+            if not remove_rate_limit_override(bucket, client):
+                click.echo("No such override")
+
+        for field, override in sorted(get_rate_limit_overrides().items()):
+            click.echo(f"{field}: {override}")
+
+    @app.cli.command("import-torrents")
+    @click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+    @click.option("--description", default="")
+    @click.option("--batch-size", type=int, default=Config.BULK_UPLOAD_BATCH_SIZE)
+    @click.option("--workers", type=int, default=os.cpu_count() or 1, help="Parsing processes.")
+    def import_torrents(paths, description, batch_size, workers):
+        """Bulk-import .torrent files, directories of them, or tar/zip archives."""
+        def entries():
+            for path in paths:
+                if os.path.isdir(path):
+                    for root, _, names in os.walk(path):
+                        for name in sorted(names):
+                            if name.endswith(".torrent"):
+                                with open(os.path.join(root, name), "rb") as f:
+                                    yield os.path.join(root, name), f.read()
+                elif path.lower().endswith(TAR_SUFFIXES) or path.lower().endswith(".zip"):
+                    with open(path, "rb") as f:
+                        yield from iter_archive(f, path)
+                else:
+                    with open(path, "rb") as f:
+                        yield path, f.read()
+
+        started = time.monotonic()
+        summary = {}
+        results = ingest_torrents(entries(), description=description, batch_size=batch_size, workers=workers)
+        for i, result in enumerate(results, 1):
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+            if result["status"] in ("invalid", "error"):
+                click.echo(f"{result['file']}: {result['error']}", err=True)
+            if i % batch_size == 0:
+                click.echo(f"{i} file(s), {i / (time.monotonic() - started):.0f} files/s, {summary}")
+
+        click.echo(f"Done in {time.monotonic() - started:.1f}s: {summary}")
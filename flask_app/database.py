@@ -1,5 +1,93 @@
+import bisect
+import threading
+import time
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from config import Config
+
+# Upper bounds (ms) of the checkout wait histogram; longer waits go to "le_inf"
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+class PoolWaitStats:
+    """
+    How long this process waited for database connections (a free one, or a
+    new one being opened) since the last drain().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, wait_ms: float, timed_out: bool = False):
+        index = bisect.bisect_left(POOL_WAIT_BUCKETS_MS, wait_ms)
+        bucket = f"le_{POOL_WAIT_BUCKETS_MS[index]}" if index < len(POOL_WAIT_BUCKETS_MS) else "le_inf"
+        with self._lock:
+            counters = self._counters
+            counters["checkouts"] = counters.get("checkouts", 0) + 1
+            counters["wait_ms_total"] = counters.get("wait_ms_total", 0.0) + wait_ms
+            counters[bucket] = counters.get(bucket, 0) + 1
+            if timed_out:
+                counters["timeouts"] = counters.get("timeouts", 0) + 1
+
+    def drain(self) -> dict:
+        """Return the counters collected so far and start over."""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+        return counters
+
+pool_wait_stats = PoolWaitStats()
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkout wait times in pool_wait_stats."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Flask-SQLAlchemy builds the engine with engine_from_config, which turns
+        # pool_timeout into an int; keep fractions of a second
+        self._timeout = Config.DB_POOL_TIMEOUT
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_wait_stats.record((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        pool_wait_stats.record((time.perf_counter() - started) * 1000)
+        return connection
 
 # Initialize the extension
 # We do not bind it to the app here; that happens in app.py
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy(engine_options={"poolclass": TimedQueuePool})
+
+if Config.DB_PGBOUNCER and Config.DB_STATEMENT_TIMEOUT:
+    @event.listens_for(Engine, "begin")
+    def _set_statement_timeout(connection):
+        # PgBouncer rejects the startup option and a session-wide SET would leak to
+        # other clients, so the timeout is scoped to each transaction
+        cursor = connection.connection.cursor()
+        cursor.execute(f"SET LOCAL statement_timeout = {Config.DB_STATEMENT_TIMEOUT}")
+        cursor.close()
+
+class LazyClient:
+    """
+    Stand-in for a service client (Elasticsearch, Redis, Keycloak) that is only
+    built on first use, so importing a module never does setup work or fails
+    because a service is down. Attribute access goes to the real client, so
+    LazyClient itself only has underscore names (redis clients have a get()).
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)
@@ -0,0 +1,69 @@
+import os
+
+# Production server for the web app:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# GUNICORN_MODE=gthread (default): worker processes with a thread pool each.
+# GUNICORN_MODE=gevent: one event loop per worker with many greenlets, for
+# traffic that mostly waits on Postgres, Redis, Elasticsearch and Keycloak.
+
+mode = os.environ.get("GUNICORN_MODE", "gthread")
+
+if mode == "gevent":
+    # Before anything else imports socket/ssl/threading, and psycopg2 must
+    # yield to the event loop while it waits for Postgres
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Every worker runs its own local rate limiter tier: set RATE_LIMIT_PROCESSES to
+# replicas x workers (or keep RATE_LIMIT_LOCAL_SHARE <= 1 / that) when changing
+# WEB_CONCURRENCY or the replica count, or clients can exceed their limits
+#
+# CPUs this container may run on (cpu_count() would report the whole host)
+cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+if mode == "gevent":
+    worker_class = "gevent"
+    workers = int(os.environ.get("WEB_CONCURRENCY", cpus))
+    worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+else:
+    worker_class = "gthread"
+    # Every worker has its own database pool: keep replicas x workers x pool size
+    # under what Postgres accepts
+    workers = int(os.environ.get("WEB_CONCURRENCY", min(2 * cpus + 1, 8)))
+    threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Import the app once in the master so workers fork with it loaded (faster
+# restarts, shared memory); every client connects on first use, so each
+# worker opens its own connections
+preload_app = True
+
+# Recycle workers now and then so slow leaks cannot grow unbounded; the
+# jitter keeps them from all restarting at the same moment
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# nginx keeps idle upstream connections for 60s (keepalive_timeout in
+# nginx.conf); staying open longer means nginx never reuses one gunicorn
+# is closing
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 75))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")
+errorlog = "-"
+
+def post_fork(server, worker):
+    # Loading the app opens no connections (the engine connects on first checkout,
+    # the Redis, Elasticsearch and Keycloak clients are LazyClients built on first
+    # use). This only guards against a pooled Postgres connection the master opened
+    # anyway: a socket shared between processes would interleave their queries
+    from wsgi import app
+    from database import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,117 @@
+from sqlalchemy import text
+from database import db
+from models import SearchOutbox, TORRENT_SEARCH_VECTOR
+
+def _column_type(table: str, column: str):
+    return db.session.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = :table AND column_name = :column"
+    ), {"table": table, "column": column}).scalar()
+
+def migrate_pieces_to_binary(batch_size: int = 1000, log=print):
+    """
+    Convert torrents.pieces from a JSON array of hex strings to a single BYTEA
+    blob and fill torrents.pieces_count.
+
+    Rows are converted in batches (one committed transaction each) into a
+    temporary pieces_blob column, so the migration can be interrupted and
+    resumed. The columns are swapped once every row has been converted.
+
+    Returns:
+        Number of rows converted
+    """
+    if _column_type("torrents", "pieces") != "json":
+        log("torrents.pieces is already binary, nothing to do")
+        return 0
+
+    db.session.execute(text(
+        "ALTER TABLE torrents "
+        "ADD COLUMN IF NOT EXISTS pieces_blob BYTEA, "
+        "ADD COLUMN IF NOT EXISTS pieces_count INTEGER"
+    ))
+    db.session.commit()
+
+    # The hex strings are decoded inside Postgres; rows never travel to the app
+    convert_batch = text("""
+        UPDATE torrents
+        SET pieces_blob = decode(
+                coalesce((SELECT string_agg(p, '' ORDER BY n)
+                          FROM json_array_elements_text(torrents.pieces) WITH ORDINALITY AS t(p, n)), ''),
+                'hex'),
+            pieces_count = json_array_length(torrents.pieces)
+        WHERE id IN (
+            SELECT id FROM torrents
+            WHERE pieces_blob IS NULL
+            ORDER BY id
+            LIMIT :batch_size
+        )
+    """)
+
+    converted = 0
+    while True:
+        result = db.session.execute(convert_batch, {"batch_size": batch_size})
+        db.session.commit()
+        if result.rowcount == 0:
+            break
+        converted += result.rowcount
+        log(f"Converted {converted} row(s)")
+
+    db.session.execute(text("ALTER TABLE torrents DROP COLUMN pieces"))
+    db.session.execute(text("ALTER TABLE torrents RENAME COLUMN pieces_blob TO pieces"))
+    db.session.execute(text("ALTER TABLE torrents ALTER COLUMN pieces SET NOT NULL"))
+    db.session.execute(text("ALTER TABLE torrents ALTER COLUMN pieces_count SET DEFAULT 0"))
+    db.session.execute(text("ALTER TABLE torrents ALTER COLUMN pieces_count SET NOT NULL"))
+    db.session.commit()
+
+    log(f"torrents.pieces migrated to BYTEA ({converted} row(s) converted)")
+    return converted
+
+def add_info_bytes_column(batch_size: int = 1000, log=print):
+    """Add torrents.info_bytes. Existing rows keep NULL and are rebuilt from their columns on download."""
+    db.session.execute(text("ALTER TABLE torrents ADD COLUMN IF NOT EXISTS info_bytes BYTEA"))
+    db.session.commit()
+    log("torrents.info_bytes present")
+
+def create_search_outbox_table(batch_size: int = 1000, log=print):
+    SearchOutbox.__table__.create(db.engine, checkfirst=True)
+    log("search_outbox table present")
+
+def add_search_indexes(batch_size: int = 1000, log=print):
+    """
+    Add the generated torrents.search_vector column and the indexes used by the
+    Postgres fallback search.
+
+    Adding a stored generated column rewrites the table once; the indexes are
+    built CONCURRENTLY so reads and writes continue meanwhile.
+    """
+    db.session.execute(text(
+        "ALTER TABLE torrents ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({TORRENT_SEARCH_VECTOR}) STORED"
+    ))
+    db.session.commit()
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_torrents_search_vector "
+            "ON torrents USING gin (search_vector)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_torrents_info_hash_prefix "
+            "ON torrents (info_hash varchar_pattern_ops)"
+        ))
+    log("torrents search indexes present")
+
+# Every migration is idempotent; `flask migrate` runs them all in order
+MIGRATIONS = [
+    migrate_pieces_to_binary,
+    add_info_bytes_column,
+    create_search_outbox_table,
+    add_search_indexes
+]
+
+def run_migrations(batch_size: int = 1000, log=print):
+    """Create missing tables, then bring existing ones up to date."""
+    db.create_all()
+    for migration in MIGRATIONS:
+        migration(batch_size=batch_size, log=log)
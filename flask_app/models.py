@@ -1,5 +1,17 @@
 from database import db
 from datetime import datetime
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
+
+# Words of the filename and description for the Postgres fallback search.
+# Punctuation is turned into spaces first so release names like
+# "Some.Show.S01E02.1080p" become separate words; the "simple" configuration
+# keeps them as typed (no stemming, no stop words). Must stay in sync with
+# search_service.to_tsquery_terms.
+TORRENT_SEARCH_VECTOR = (
+    "to_tsvector('simple'::regconfig, regexp_replace("
+    "coalesce(filename, '') || ' ' || coalesce(description, ''), '[^[:alnum:]]+', ' ', 'g'))"
+)
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -13,6 +25,11 @@ class User(db.Model):
 
 class Torrent(db.Model):
     __tablename__ = 'torrents'
+    __table_args__ = (
+        db.Index('ix_torrents_search_vector', 'search_vector', postgresql_using='gin'),
+        # LIKE 'prefix%' lookups on info_hash (the unique index cannot serve them outside the C locale)
+        db.Index('ix_torrents_info_hash_prefix', 'info_hash', postgresql_ops={'info_hash': 'varchar_pattern_ops'})
+    )
     id = db.Column(db.Integer, primary_key=True)
     info_hash = db.Column(db.String(40), unique=True, nullable=False, index=True)
     filename = db.Column(db.String(255), nullable=False, index=True)
@@ -21,7 +38,16 @@ class Torrent(db.Model):
     # File and piece information
     file_size = db.Column(db.BigInteger, nullable=False)  # Total size in bytes
     piece_length = db.Column(db.Integer, nullable=False)  # Length of each piece
-    pieces = db.Column(db.JSON, nullable=False)  # Array of piece hashes (SHA-1)
+    # Concatenated 20-byte SHA-1 piece hashes, exactly as in the .torrent.
+    # Deferred: only downloads need it, everything else uses pieces_count.
+    pieces = deferred(db.Column(db.LargeBinary, nullable=False))
+    pieces_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # The bencoded info dict exactly as uploaded; downloads are served from it as-is
+    info_bytes = deferred(db.Column(db.LargeBinary, nullable=True))
+
+    # Generated by Postgres, only used in WHERE clauses
+    search_vector = deferred(db.Column(TSVECTOR, db.Computed(TORRENT_SEARCH_VECTOR, persisted=True)))
 
     # Files within torrent (for multi-file torrents)
     files = db.Column(db.JSON, nullable=True)  # Array of {path, length, hash}
@@ -48,4 +74,18 @@ class Comment(db.Model):
     # user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     user_id = db.Column(db.Integer, default=1, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SearchOutbox(db.Model):
+    """
+    Pending Elasticsearch writes, appended in the same transaction as the change
+    they describe and drained by `flask search-worker`.
+    """
+    __tablename__ = 'search_outbox'
+    id = db.Column(db.BigInteger, primary_key=True)
+    torrent_id = db.Column(db.Integer, nullable=False, index=True)
+    operation = db.Column(db.String(10), nullable=False)  # index, update, delete
+    payload = db.Column(db.JSON, nullable=True)  # Partial document for "update"
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
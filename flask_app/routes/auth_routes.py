@@ -1,12 +1,14 @@
-import requests
 from flask import Blueprint, request, jsonify
 from models import User, db
-from services.auth_service import login_user, get_keycloak_admin_token, require_roles, get_keycloak_user_id, get_role_representation
+from services.auth_service import login_user, require_roles
+from services.keycloak_service import get_user_id, get_role_representation, create_user, delete_user, replace_realm_role, bulk_replace_realm_roles
 from services.redis_service import rate_limit
 from config import Config
 
 auth_bp = Blueprint("auth", __name__)
 
+VALID_ROLES = ['visitor', 'normal', 'uploader', 'admin']
+
 @auth_bp.route("/auth/register", methods=["POST"])
 @rate_limit()
 def register():
@@ -36,19 +38,10 @@ def register():
     }
 
     try:
-        keycloak_admin_token = get_keycloak_admin_token()
+        response = create_user(new_user_payload)
     except Exception as e:
         return jsonify({"error": "Backend authentication failed"}), 500
 
-    create_url = Config.KEYCLOAK_SERVER_URL + "/admin/realms/" + Config.KEYCLOAK_REALM + "/users"
-
-    headers = {
-        "Authorization": f"Bearer {keycloak_admin_token}",
-        "Content-Type": "application/json"
-    }
-
-    response = requests.post(create_url, json=new_user_payload, headers=headers)
-
     if response.status_code == 201:
         try:
             # Check if user already exists in DB
@@ -67,7 +60,7 @@ def register():
 
             user_location = response.headers.get("Location")
             if user_location:
-                requests.delete(user_location, headers=headers)
+                delete_user(user_location)
 
             return jsonify({"error": "Database insert failed. Keycloak user deleted.", "details": str(e)}), 500
     elif response.status_code == 409:
@@ -117,9 +110,8 @@ def update_user_role(user_id):
     data = request.get_json()
     new_role = data.get('role')
 
-    valid_roles = ['visitor', 'normal', 'uploader', 'admin']
-    if not new_role or new_role not in valid_roles:
-        return jsonify({"error": f"Invalid role. Must be one of: {valid_roles}"}), 400
+    if not new_role or new_role not in VALID_ROLES:
+        return jsonify({"error": f"Invalid role. Must be one of: {VALID_ROLES}"}), 400
 
     user = User.query.get(user_id)
     if not user:
@@ -130,28 +122,18 @@ def update_user_role(user_id):
         return jsonify({"message": "User already has this role"}), 200
 
     try:
-        kc_admin_token = get_keycloak_admin_token()
-        kc_user_id = get_keycloak_user_id(kc_admin_token, user.username)
+        kc_user_id = get_user_id(user.username)
 
         if not kc_user_id:
             return jsonify({"error": "Sync Error: User found locally but not in Keycloak"}), 500
 
-        new_role_rep = get_role_representation(kc_admin_token, new_role)
-        old_role_rep = get_role_representation(kc_admin_token, old_role)
+        new_role_rep = get_role_representation(new_role)
+        old_role_rep = get_role_representation(old_role)
 
         if not new_role_rep:
              return jsonify({"error": f"Role '{new_role}' does not exist in Keycloak settings"}), 500
 
-        mapping_url = f"{Config.KEYCLOAK_SERVER_URL}/admin/realms/{Config.KEYCLOAK_REALM}/users/{kc_user_id}/role-mappings/realm"
-        headers = {
-            "Authorization": f"Bearer {kc_admin_token}",
-            "Content-Type": "application/json"
-        }
-
-        if old_role_rep:
-            requests.delete(mapping_url, json=[old_role_rep], headers=headers)
-
-        resp = requests.post(mapping_url, json=[new_role_rep], headers=headers)
+        resp = replace_realm_role(kc_user_id, new_role_rep, old_role_rep)
 
         if resp.status_code not in [204, 200]:
             return jsonify({"error": "Failed to update Keycloak role", "details": resp.text}), 500
@@ -171,6 +153,87 @@ def update_user_role(user_id):
         db.session.rollback()
         return jsonify({"error": "Database update failed", "details": str(e)}), 500
 
+@auth_bp.route('/users/roles', methods=['PUT'])
+@rate_limit()
+@require_roles("admin")
+def bulk_update_user_roles():
+    """
+    Change the role of many users at once.
+
+    Body: [{"user_id": 1, "role": "uploader"}, ...]
+    Keycloak is updated concurrently; local users are committed in one transaction.
+    """
+    data = request.get_json(silent=True)
+
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Body must be a non-empty list of {user_id, role}"}), 400
+
+    if len(data) > Config.BULK_ROLE_UPDATE_MAX:
+        return jsonify({"error": f"At most {Config.BULK_ROLE_UPDATE_MAX} users per request"}), 400
+
+    results = []
+    requested = {}
+    for entry in data:
+        user_id = entry.get("user_id") if isinstance(entry, dict) else None
+        new_role = entry.get("role") if isinstance(entry, dict) else None
+        result = {"user_id": user_id, "role": new_role}
+        results.append(result)
+
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            result["error"] = "Missing or invalid user_id"
+        elif new_role not in VALID_ROLES:
+            result["error"] = f"Invalid role. Must be one of: {VALID_ROLES}"
+        elif user_id in requested:
+            result["error"] = "Duplicate user_id in request"
+        else:
+            requested[user_id] = result
+
+    users = {u.id: u for u in User.query.filter(User.id.in_(requested.keys())).all()} if requested else {}
+
+    # Keycloak changes, sorted by target role so each role representation is fetched once
+    changes = []
+    for user_id, result in requested.items():
+        user = users.get(user_id)
+        if not user:
+            result["error"] = "User not found"
+        elif user.role == result["role"]:
+            result["message"] = "User already has this role"
+        else:
+            changes.append((user.username, user.role, result["role"], user, result))
+    changes.sort(key=lambda change: change[2])
+
+    if changes:
+        try:
+            errors = bulk_replace_realm_roles([change[:3] for change in changes])
+        except Exception as e:
+            return jsonify({"error": "Backend connection failed", "details": str(e)}), 500
+
+        updated = []
+        for username, old_role, new_role, user, result in changes:
+            if errors.get(username):
+                result["error"] = errors[username]
+                continue
+            result["keycloak_updated"] = True
+            user.role = new_role
+            updated.append(result)
+
+        try:
+            db.session.commit()
+            for result in updated:
+                result["local_updated"] = True
+        except Exception as e:
+            db.session.rollback()
+            for result in updated:
+                result["local_updated"] = False
+                result["error"] = f"Database update failed: {e}"
+
+    failed = sum(1 for result in results if "error" in result)
+    return jsonify({
+        "updated": sum(1 for result in results if result.get("local_updated")),
+        "failed": failed,
+        "results": results
+    }), 200 if not failed else 207
+
 @auth_bp.route("/")
 @rate_limit()
 def hello_world():
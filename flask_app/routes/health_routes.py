@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify
+import redis
+from services.auth_service import require_roles
+from services.health_service import check_readiness
+from services.pool_metrics_service import get_pool_metrics, reset_pool_metrics
+
+health_bp = Blueprint("health", __name__)
+
+@health_bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 200 once Postgres and Redis answer (connecting to every
+    dependency on the way), 503 otherwise. Not rate limited.
+    """
+    is_ready, checks = check_readiness()
+    return jsonify({"ready": is_ready, "checks": checks}), 200 if is_ready else 503
+
+@health_bp.route("/db/pool-metrics", methods=["GET"])
+@require_roles("admin")
+def pool_metrics():
+    """How long requests waited for a database connection, across all replicas."""
+    try:
+        return jsonify(get_pool_metrics()), 200
+    except redis.RedisError as e:
+        return jsonify({"error": "Metrics unavailable", "details": str(e)}), 503
+
+@health_bp.route("/db/pool-metrics", methods=["DELETE"])
+@require_roles("admin")
+def clear_pool_metrics():
+    """Start a new measurement, e.g. after changing the pool size."""
+    try:
+        reset_pool_metrics()
+        return jsonify({"message": "Pool metrics reset"}), 200
+    except redis.RedisError as e:
+        return jsonify({"error": "Metrics unavailable", "details": str(e)}), 503
@@ -1,18 +1,40 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response
 from models import User, Torrent, Comment, db
-from services.auth_service import require_roles, get_keycloak_user_id, get_role_representation
+from services.auth_service import require_roles
 from services.redis_service import rate_limit
-from services.elastic_service import index_torrent, search_torrents_elasticsearch, delete_torrent_index, update_torrent_swarm_info
+from services.elastic_service import search_torrents_elasticsearch, suggest_torrents, PointInTimeExpired
+from services.search_service import (
+    parse_search_params, encode_cursor, decode_cursor, search_postgres, CursorError
+)
+from services.search_outbox_service import enqueue_index, enqueue_delete
+from services.swarm_service import register_torrents, unregister_torrent
+from services.torrent_file_service import (
+    parse_torrent_file, load_torrent_file, make_etag,
+    get_cached_torrent_file_meta, get_cached_torrent_file_body, cache_torrent_file, invalidate_torrent_file
+)
+from services.torrent_service import (
+    fetch_torrent_details, get_cached_torrent_details_etag, get_cached_torrent_details, cache_torrent_details,
+    invalidate_torrent_details, DELETED_VERSION
+)
+from services.ingest_service import ingest_torrents, iter_uploads, iter_archive
+from services.search_cache_service import (
+    search_cache_key, cached_search, invalidate_search_cache, get_search_cache_metrics
+)
 from config import Config
-import bencodepy
-import hashlib
+import redis
 from datetime import datetime, timedelta
 import struct
 import random
 import io
+import itertools
+import tarfile
+import tempfile
+import zipfile
 
 torrent_bp = Blueprint("torrents", __name__)
 
+TAR_MIMETYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip', 'application/x-bzip2', 'application/x-xz')
+
 @torrent_bp.route("/torrents", methods=["POST"])
 @rate_limit()
 @require_roles("admin", "uploader")
@@ -31,44 +53,17 @@ def upload_torrent():
             return jsonify({"error": "File must be a .torrent file"}), 400
 
         # Parse torrent file
-        torrent_data = bencodepy.decode(torrent_file.read())
+        try:
+            fields = parse_torrent_file(torrent_file.read())
+        except ValueError as e:
+            return jsonify({"error": "Invalid torrent file", "details": str(e)}), 400
 
-        # Extract info_hash
-        info_bytes = bencodepy.encode(torrent_data[b'info'])
-        info_hash = hashlib.sha1(info_bytes).hexdigest()
+        info_hash = fields["info_hash"]
 
         # Check if torrent already exists
         if Torrent.query.filter_by(info_hash=info_hash).first():
             return jsonify({"error": "Torrent already exists"}), 409
 
-        # Extract torrent information
-        info = torrent_data[b'info']
-        filename = info[b'name'].decode('utf-8')
-        piece_length = info[b'piece length']
-        pieces = info[b'pieces']  # Raw bytes of concatenated SHA-1 hashes
-
-        # Convert pieces to list of hex strings
-        pieces_list = [pieces[i:i+20].hex() for i in range(0, len(pieces), 20)]
-
-        # Calculate total file size
-        file_size = 0
-        files_list = []
-
-        if b'files' in info:
-            # Multi-file torrent
-            for file_info in info[b'files']:
-                file_path = '/'.join([p.decode('utf-8') for p in file_info[b'path']])
-                file_length = file_info[b'length']
-                file_size += file_length
-                files_list.append({
-                    "path": file_path,
-                    "length": file_length
-                })
-        else:
-            # Single-file torrent
-            file_size = info[b'length']
-            files_list = None
-
         # Get current user (implement based on your auth setup)
         user_id = 1
         if not user_id:
@@ -76,125 +71,300 @@ def upload_torrent():
 
         # Create torrent record
         new_torrent = Torrent(
-            info_hash=info_hash,
-            filename=filename,
             description=description,
-            file_size=file_size,
-            piece_length=piece_length,
-            pieces=pieces_list,
-            files=files_list if files_list else None,
             uploader_id=user_id,
             seeders=0,
             leechers=0,
-            completed=0
+            completed=0,
+            **fields
         )
 
         db.session.add(new_torrent)
+        db.session.flush()
+
+        # Queued for Elasticsearch in the same transaction; the search worker indexes it
+        enqueue_index([new_torrent.id])
         db.session.commit()
 
-        # Index in Elasticsearch
-        index_torrent(new_torrent)
+        # Let the tracker accept announces for it
+        register_torrents([bytes.fromhex(info_hash)])
+        invalidate_search_cache()
 
         return jsonify({
             "message": "Torrent uploaded successfully",
             "torrent_id": new_torrent.id,
             "info_hash": info_hash,
-            "filename": filename,
-            "file_size": file_size,
-            "pieces_count": len(pieces_list)
+            "filename": new_torrent.filename,
+            "file_size": new_torrent.file_size,
+            "pieces_count": new_torrent.pieces_count
         }), 201
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Failed to upload torrent", "details": str(e)}), 500
 
+def _upload_too_large():
+    return jsonify({"error": f"Multipart and zip uploads are limited to {Config.BULK_UPLOAD_MAX_SPOOL_SIZE} bytes; "
+                             f"send a tar archive as the request body instead"}), 413
+
+@torrent_bp.route("/torrents/bulk", methods=["POST"])
+@rate_limit()
+@require_roles("admin", "uploader")
+def bulk_upload_torrents():
+    """
+    Ingest many .torrent files in one request.
+
+    Accepts multipart "files" (.torrent files and/or .tar/.tar.gz/.zip archives
+    of them), or a raw tar (optionally compressed) / zip request body.
+
+    Only raw tar bodies are streamed. Multipart forms are spooled by Werkzeug
+    and zip bodies by us before parsing starts, so both are limited to
+    BULK_UPLOAD_MAX_SPOOL_SIZE bytes.
+
+    Batches are committed as they go: if the upload breaks off (a corrupt
+    archive, a dropped connection), the report of what was already processed
+    is returned with an "error" and status 207.
+    """
+    try:
+        description = ''
+
+        if request.mimetype == 'multipart/form-data':
+            if request.content_length is None:
+                return jsonify({"error": "Content-Length is required for multipart uploads"}), 411
+            if request.content_length > Config.BULK_UPLOAD_MAX_SPOOL_SIZE:
+                return _upload_too_large()
+            description = request.form.get('description', '')
+            uploads = request.files.getlist('files') + request.files.getlist('file')
+            if not uploads:
+                return jsonify({"error": "No torrent files provided"}), 400
+            entries = iter_uploads(uploads)
+        elif request.mimetype in TAR_MIMETYPES:
+            # Streamed straight from the socket, never fully buffered
+            entries = iter_archive(request.stream, "upload.tar")
+        elif request.mimetype == 'application/zip':
+            # zip needs a seekable file; spool the body to a temporary file
+            spooled = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+            copied = 0
+            while True:
+                chunk = request.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                copied += len(chunk)
+                if copied > Config.BULK_UPLOAD_MAX_SPOOL_SIZE:
+                    spooled.close()
+                    return _upload_too_large()
+                spooled.write(chunk)
+            spooled.seek(0)
+            entries = iter_archive(spooled, "upload.zip")
+        else:
+            return jsonify({"error": "Expected multipart/form-data, a tar archive or a zip archive"}), 415
+    except Exception as e:
+        return jsonify({"error": "Failed to read bulk upload", "details": str(e)}), 400
+
+    # Get current user (implement based on your auth setup)
+    user_id = 1
+
+    report = []
+    error = None
+    limited = itertools.islice(entries, Config.BULK_UPLOAD_MAX_FILES)
+    try:
+        for result in ingest_torrents(limited, description=description, uploader_id=user_id):
+            report.append(result)
+        truncated = next(entries, None) is not None
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+        db.session.rollback()
+        error, status = f"Invalid archive: {e}", 400
+    except Exception as e:
+        db.session.rollback()
+        error, status = f"Failed to process bulk upload: {e}", 500
+
+    if error and not report:
+        return jsonify({"error": error}), status
+
+    summary = {}
+    for result in report:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+    response = {
+        "message": "Bulk upload processed",
+        "total": len(report),
+        "summary": summary,
+        "truncated": False if error else truncated,
+        "results": report
+    }
+    if error:
+        # Earlier batches are committed; the rest of the upload was not processed
+        response["error"] = error
+        return jsonify(response), 207
+    return jsonify(response), 200
+
 @torrent_bp.route("/search", methods=["GET"])
 @rate_limit()
 @require_roles("admin", "uploader", "normal")
 def search():
-    query = request.args.get("q", "").strip()
-    limit = request.args.get("limit", 50, type=int)
-
-    if not query or len(query) < 2:
-        return jsonify({"error": "Search query must be at least 2 characters"}), 400
+    """
+    Search torrents, one page at a time.
 
+    The first request carries q plus optional sort/order and filters; every
+    response has a next_cursor (null on the last page) that is passed back as
+    ?cursor= to get the following page with the same query.
+    """
+    limit = request.args.get("limit", 50, type=int)
     if limit > 200:
         limit = 200  # Cap the limit
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
 
+    cursor = request.args.get("cursor")
     try:
-        # Try Elasticsearch first
-        es_results = search_torrents_elasticsearch(query, limit)
+        if cursor:
+            state = decode_cursor(cursor)
+            query, sort, order, filters = state["q"], state["sort"], state["order"], state["filters"]
+        else:
+            state = {}
+            query = request.args.get("q", "").strip()
+            if not query or len(query) < 2:
+                return jsonify({"error": "Search query must be at least 2 characters"}), 400
+            sort, order, filters = parse_search_params(request.args)
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": str(e) if isinstance(e, ValueError) else "Invalid cursor"}), 400
+
+    def compute():
+        response, status = _search_page(query, limit, sort, order, filters, state)
+        return response.get_data(), status
+
+    # Queries differing only in case or spacing share an entry
+    normalized = " ".join(query.lower().split())
+    digest = search_cache_key(normalized, limit, sort, order, filters, cursor)
+    body, status, hit = cached_search(digest, compute)
+
+    response = Response(body, status=status, mimetype="application/json")
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return response
+
+def _search_page(query, limit, sort, order, filters, state):
+    """Run one page of a search. Returns (JSON response, status)."""
+    page_state = {"q": query, "sort": sort, "order": order, "filters": filters}
 
-        if es_results:
-            return jsonify({
-                "query": query,
-                "count": len(es_results),
-                "results": es_results,
-                "source": "elasticsearch"
-            }), 200
+    try:
+        # Try Elasticsearch first (a cursor sticks to the source that produced it)
+        if state.get("source") != "postgresql":
+            page = search_torrents_elasticsearch(
+                query, limit, sort=sort, order=order, filters=filters,
+                pit_id=state.get("pit_id"), search_after=state.get("after")
+            )
+
+            if page is not None:
+                next_cursor = None
+                if page["search_after"]:
+                    next_cursor = encode_cursor(dict(page_state, source="elasticsearch",
+                                                     pit_id=page["pit_id"], after=page["search_after"]))
+                return jsonify({
+                    "query": query,
+                    "count": len(page["results"]),
+                    "results": page["results"],
+                    "source": "elasticsearch",
+                    "next_cursor": next_cursor
+                }), 200
+
+            if state:
+                return jsonify({"error": "Search is temporarily unavailable, start the search again"}), 503
 
         # Fallback to PostgreSQL
-        torrents = Torrent.query.filter(
-            (Torrent.filename.ilike(f"%{query}%")) |
-            (Torrent.description.ilike(f"%{query}%")) |
-            (Torrent.info_hash.ilike(f"%{query}%"))
-        ).limit(limit).all()
-
-        results = [{
-            "id": t.id,
-            "filename": t.filename,
-            "description": t.description,
-            "info_hash": t.info_hash,
-            "file_size": t.file_size,
-            "seeders": t.seeders,
-            "leechers": t.leechers,
-            "completed": t.completed,
-            "created_at": t.created_at.isoformat()
-        } for t in torrents]
+        results, after = search_postgres(query, limit, sort=sort, order=order, filters=filters,
+                                         after=state.get("after"))
 
         return jsonify({
             "query": query,
             "count": len(results),
             "results": results,
-            "source": "postgresql"
+            "source": "postgresql",
+            "next_cursor": encode_cursor(dict(page_state, source="postgresql", after=after)) if after else None
         }), 200
 
+    except (CursorError, PointInTimeExpired):
+        return jsonify({"error": "Cursor expired or invalid, start the search again"}), 400
     except Exception as e:
         return jsonify({"error": "Search failed", "details": str(e)}), 500
 
+@torrent_bp.route("/search/suggest", methods=["GET"])
+@rate_limit(limit=Config.SUGGEST_RATE_LIMIT, bucket="suggest")
+@require_roles("admin", "uploader", "normal")
+def suggest():
+    """
+    Complete a torrent name as the user types (?q=<prefix>&limit=<n>).
+
+    Backed by the completion suggester, so it is a lookup in memory rather than
+    a fuzzy full-text search; suggestions come best seeded first.
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Missing q"}), 400
+
+    limit = min(request.args.get("limit", 10, type=int), Config.SUGGEST_MAX_RESULTS)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    suggestions = suggest_torrents(query, limit)
+    if suggestions is None:
+        return jsonify({"error": "Suggestions are temporarily unavailable"}), 503
+
+    return jsonify({"query": query, "suggestions": suggestions}), 200
+
+@torrent_bp.route("/search/cache-metrics", methods=["GET"])
+@require_roles("admin")
+def search_cache_metrics():
+    """Hit rate and counters of the search result cache."""
+    try:
+        return jsonify(get_search_cache_metrics()), 200
+    except redis.RedisError as e:
+        return jsonify({"error": "Cache unavailable", "details": str(e)}), 503
+
 @torrent_bp.route("/torrents/<int:torrent_id>", methods=["GET"])
 @rate_limit()
 @require_roles("admin", "uploader", "normal")
 def get_torrent_details(torrent_id):
+    """
+    Torrent metadata, served from the Redis response cache when possible. A
+    conditional request whose ETag is still current is answered with a 304
+    without reading the body.
+    """
     try:
-        torrent = Torrent.query.get(torrent_id)
+        if request.if_none_match:
+            etag = get_cached_torrent_details_etag(torrent_id)
+            if etag and request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
 
-        if not torrent:
-            return jsonify({"error": "Torrent not found"}), 404
+        cached = get_cached_torrent_details(torrent_id)
 
-        # comments = [{
-        #     "id": c.id,
-        #     "content": c.content,
-        #     "author": c.author.username,
-        #     "created_at": c.created_at.isoformat()
-        # } for c in torrent.comments]
+        if cached:
+            etag, body = cached
+        else:
+            loaded = fetch_torrent_details(torrent_id)
 
-        return jsonify({
-            "id": torrent.id,
-            "filename": torrent.filename,
-            "description": torrent.description,
-            "info_hash": torrent.info_hash,
-            "file_size": torrent.file_size,
-            "piece_length": torrent.piece_length,
-            "pieces_count": len(torrent.pieces),
-            "files": torrent.files,
-            "seeders": torrent.seeders,
-            "leechers": torrent.leechers,
-            "completed": torrent.completed,
-            "uploader": torrent.uploader.username,
-            "created_at": torrent.created_at.isoformat(),
-            # "comments": comments
-        }), 200
+            if not loaded:
+                return jsonify({"error": "Torrent not found"}), 404
+
+            details, version = loaded
+
+            # comments = [{
+            #     "id": c.id,
+            #     "content": c.content,
+            #     "author": c.author.username,
+            #     "created_at": c.created_at.isoformat()
+            # } for c in torrent.comments]
+            # details["comments"] = comments
+
+            body = jsonify(details).get_data()
+            etag = make_etag(body)
+            cache_torrent_details(torrent_id, version, etag, body)
+
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["X-Cache"] = "HIT" if cached else "MISS"
+        return response.make_conditional(request)
 
     except Exception as e:
         return jsonify({"error": "Failed to fetch torrent", "details": str(e)}), 500
@@ -209,12 +379,19 @@ def delete_torrent(torrent_id):
         if not torrent:
             return jsonify({"error": "Torrent not found"}), 404
 
-        delete_torrent_index(torrent.id)
+        info_hash = torrent.info_hash
+        enqueue_delete(torrent.id)
 
         # Comment.query.filter_by(torrent_id=torrent_id).delete()
 
         db.session.delete(torrent)
         db.session.commit()
+        # Only once the row is gone, so a download or announce racing the delete
+        # cannot cache the torrent again and a failed commit leaves it usable
+        unregister_torrent(bytes.fromhex(info_hash))
+        invalidate_torrent_file(torrent_id)
+        invalidate_search_cache()
+        invalidate_torrent_details([torrent_id], DELETED_VERSION)
 
         return jsonify({
             "message": "Torrent deleted successfully",
@@ -231,53 +408,36 @@ def delete_torrent(torrent_id):
 @require_roles("admin", "uploader", "normal")
 def download_torrent(torrent_id):
     try:
-        torrent = Torrent.query.get(torrent_id)
+        cached = get_cached_torrent_file_meta(torrent_id)
 
-        if not torrent:
-            return jsonify({"error": "Torrent not found"}), 404
+        # Conditional re-fetch of a cached file: answered without reading the body
+        if cached and request.if_none_match.contains(cached[0]):
+            response = Response(status=304)
+            response.set_etag(cached[0])
+            return response
+
+        body = get_cached_torrent_file_body(torrent_id) if cached else None
 
-        info = {
-            b'name': torrent.filename.encode('utf-8'),
-            b'piece length': torrent.piece_length,
-            b'pieces': b''.join(bytes.fromhex(piece) for piece in torrent.pieces)
-        }
-
-        if torrent.files:
-            # Multi-file torrent
-            files = []
-            for file_info in torrent.files:
-                file_path = file_info.get('path', '').split('/')
-                files.append({
-                    b'path': [p.encode('utf-8') for p in file_path],
-                    b'length': file_info.get('length', 0)
-                })
-            info[b'files'] = files
+        if body is not None:
+            etag, filename = cached
         else:
-            # Single-file torrent
-            info[b'length'] = torrent.file_size
+            loaded = load_torrent_file(torrent_id)
 
-        torrent_dict = {
-            b'announce': b'http://localhost/announce',
-            b'info': info,
-            b'creation date': int(torrent.created_at.timestamp()),
-            b'created by': b'torrent-tracker'
-        }
+            if not loaded:
+                return jsonify({"error": "Torrent not found"}), 404
 
-        torrent_data = bencodepy.encode(torrent_dict)
+            filename, body = loaded
+            etag = make_etag(body)
 
-        buffer = io.BytesIO(torrent_data)
-        buffer.seek(0)
+            cache_torrent_file(torrent_id, etag, filename, body)
 
         return send_file(
-            buffer,
+            io.BytesIO(body),
             mimetype='application/x-bencoded',
             as_attachment=True,
-            download_name=f"{torrent.filename}.torrent"
+            download_name=filename,
+            etag=etag
         )
 
     except Exception as e:
         return jsonify({"error": "Failed to download torrent", "details": str(e)}), 500
-
-@torrent_bp.route("/announce", methods=["GET"])
-def announce():
-    return jsonify({"error": "Not relevant to the project. (damblaua mea pt cand am timp liber)"}), 418
\ No newline at end of file
@@ -0,0 +1,134 @@
+from flask import Blueprint, request, Response, jsonify
+from urllib.parse import unquote_to_bytes
+from services.swarm_service import announce_peer, get_swarm_counts, get_sync_metrics, AnnounceError
+from services.auth_service import require_roles
+from config import Config
+import bencodepy
+import redis
+
+tracker_bp = Blueprint("tracker", __name__)
+
+def parse_query_string(raw: bytes):
+    """
+    Parse a query string without decoding the values as text.
+
+    info_hash and peer_id are arbitrary bytes, so request.args (which decodes
+    them as UTF-8) would corrupt them.
+    """
+    params = {}
+    for pair in raw.split(b"&"):
+        if not pair:
+            continue
+        key, _, value = pair.partition(b"=")
+        key = unquote_to_bytes(key.replace(b"+", b" ")).decode("latin-1")
+        params.setdefault(key, []).append(unquote_to_bytes(value.replace(b"+", b" ")))
+    return params
+
+def _int_param(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise AnnounceError(f"missing {name}")
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise AnnounceError(f"invalid {name}")
+
+def bencoded_response(payload: dict):
+    # Trackers always answer 200; errors are carried in "failure reason"
+    return Response(bencodepy.encode(payload), status=200, mimetype="text/plain")
+
+def failure(reason: str):
+    return bencoded_response({b"failure reason": reason.encode("utf-8")})
+
+@tracker_bp.route("/announce", methods=["GET"])
+def announce():
+    params = parse_query_string(request.query_string)
+
+    try:
+        info_hash = params.get("info_hash", [b""])[0]
+        peer_id = params.get("peer_id", [b""])[0]
+        port = _int_param(params, "port")
+        # Required by BEP 3; defaulting it would count the peer as a seeder
+        left = _int_param(params, "left")
+        numwant = _int_param(params, "numwant", Config.TRACKER_DEFAULT_NUMWANT)
+        event = params.get("event", [b""])[0].decode("latin-1")
+        compact = params.get("compact", [b"1"])[0] != b"0"
+
+        swarm = announce_peer(
+            info_hash=info_hash,
+            peer_id=peer_id,
+            ip=request.remote_addr,
+            port=port,
+            left=left,
+            event=event,
+            numwant=numwant
+        )
+    except AnnounceError as e:
+        return failure(str(e))
+    except redis.RedisError:
+        return failure("tracker temporarily unavailable")
+
+    payload = {
+        b"interval": Config.TRACKER_ANNOUNCE_INTERVAL,
+        b"min interval": Config.TRACKER_MIN_ANNOUNCE_INTERVAL,
+        b"complete": swarm["complete"],
+        b"incomplete": swarm["incomplete"],
+        b"downloaded": swarm["downloaded"]
+    }
+
+    if compact:
+        payload[b"peers"] = swarm["peers"]
+        if swarm["peers6"]:
+            payload[b"peers6"] = swarm["peers6"]
+    else:
+        payload[b"peers"] = [{
+            b"peer id": other_id,
+            b"ip": other_ip.encode("ascii"),
+            b"port": other_port
+        } for other_id, other_ip, other_port in swarm["peer_list"]]
+
+    return bencoded_response(payload)
+
+@tracker_bp.route("/scrape", methods=["GET"])
+def scrape():
+    params = parse_query_string(request.query_string)
+
+    # Keep the order, drop duplicates
+    info_hashes = list(dict.fromkeys(params.get("info_hash", [])))
+
+    if not info_hashes:
+        # Full scrapes would walk the whole registry; not supported
+        return failure("info_hash is required")
+
+    if len(info_hashes) > Config.TRACKER_MAX_SCRAPE:
+        return failure(f"too many info_hash values (max {Config.TRACKER_MAX_SCRAPE})")
+
+    if any(len(info_hash) != 20 for info_hash in info_hashes):
+        return failure("invalid info_hash")
+
+    try:
+        counts = get_swarm_counts(info_hashes, registered_only=True)
+    except redis.RedisError:
+        return failure("tracker temporarily unavailable")
+
+    files = {
+        info_hash: {
+            b"complete": complete,
+            b"incomplete": incomplete,
+            b"downloaded": downloaded
+        }
+        for info_hash, (complete, incomplete, downloaded) in counts.items()
+    }
+
+    return bencoded_response({b"files": files})
+
+@tracker_bp.route("/tracker/sync-metrics", methods=["GET"])
+@require_roles("admin")
+def sync_metrics():
+    """Buffer size, flush latency and writes saved by swarm-count coalescing."""
+    try:
+        return jsonify(get_sync_metrics()), 200
+    except redis.RedisError as e:
+        return jsonify({"error": "Swarm store unavailable", "details": str(e)}), 503
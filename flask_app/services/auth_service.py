@@ -1,15 +1,22 @@
 from keycloak import KeycloakOpenID, KeycloakAdmin, KeycloakError
 from flask import request, jsonify, g
 from functools import wraps
+from jose import jwt, jwk, JWTError
+from jose.exceptions import JWKError
+from services.keycloak_service import keycloak_request, TTLCache
+from database import LazyClient
 from config import Config
 import requests
+import hashlib
+import threading
+import time
 
-keycloak_openid = KeycloakOpenID(
+keycloak_openid = LazyClient(lambda: KeycloakOpenID(
     server_url=Config.KEYCLOAK_SERVER_URL,
     client_id=Config.KEYCLOAK_CLIENT_ID,
     realm_name=Config.KEYCLOAK_REALM,
     client_secret_key=Config.KEYCLOAK_CLIENT_SECRET
-)
+))
 
 def get_keycloak_admin_client():
     return KeycloakAdmin(
@@ -21,49 +28,124 @@ def get_keycloak_admin_client():
         verify=True
     )
 
-def get_keycloak_admin_token():
-    url = Config.KEYCLOAK_SERVER_URL + "/realms/master/protocol/openid-connect/token"
-    payload = {
-        "client_id": "admin-cli",
-        "username": "admin",
-        "password": "admin",
-        "grant_type": "password"
-    }
+class TokenCache(TTLCache):
+    """Verified tokens, keyed by the SHA-256 of the token. Entries never outlive the token's own `exp`."""
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get_token(self, token: str):
+        return self.get(self.key(token))
+
+    def put_token(self, token: str, info: dict, ttl: int = None):
+        ttl = self.ttl if ttl is None else ttl
+        if info.get("exp"):
+            ttl = min(ttl, info["exp"] - time.time())
+        if ttl > 0:
+            self.put(self.key(token), info, ttl)
+
+token_cache = TokenCache(Config.AUTH_TOKEN_CACHE_SIZE, Config.AUTH_TOKEN_CACHE_TTL)
+
+class JWKSCache:
+    """The realm's signing keys, fetched once and re-fetched when a token carries an unknown `kid`."""
+    def __init__(self, url: str, min_refresh_interval: int):
+        self.url = url
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        resp = keycloak_request("GET", self.url)
+        resp.raise_for_status()
+        keys = {}
+        for key_data in resp.json().get("keys", []):
+            if key_data.get("use", "sig") != "sig" or "kid" not in key_data:
+                continue
+            keys[key_data["kid"]] = jwk.construct(key_data, key_data.get("alg", "RS256"))
+        self._keys = keys
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._keys)
+
+    def warm(self) -> bool:
+        """Fetch the keys unless they are loaded (at most every min_refresh_interval). Returns whether they are."""
+        if self._keys:
+            return True
+        with self._lock:
+            if not self._keys and time.time() - self._last_refresh >= self.min_refresh_interval:
+                self._last_refresh = time.time()
+                self.refresh()
+        return bool(self._keys)
+
+    def get(self, kid: str):
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        with self._lock:
+            key = self._keys.get(kid)
+            # Rotation: refetch, but don't let tokens with made-up kids hammer Keycloak
+            if key is None and time.time() - self._last_refresh >= self.min_refresh_interval:
+                self._last_refresh = time.time()
+                try:
+                    self.refresh()
+                except (requests.RequestException, ValueError, KeyError, JWKError) as e:
+                    # Unreachable, or a body that is not a key set
+                    print(f"Failed to fetch JWKS from {self.url}: {e}")
+                key = self._keys.get(kid)
+        return key
+
+jwks_cache = JWKSCache(Config.KEYCLOAK_CERTS, Config.AUTH_JWKS_MIN_REFRESH_INTERVAL)
+
+def verify_jwt_locally(token):
+    """
+    Verify a Keycloak access token against the realm's JWKS.
 
-    response = requests.post(url, data=payload)
-    response.raise_for_status()
-    return response.json()["access_token"]
+    Only access tokens issued to this app's client are accepted: ID tokens
+    and tokens of other clients in the realm are signed with the same keys.
 
-def get_keycloak_user_id(admin_token, username):
-    url = f"{Config.KEYCLOAK_SERVER_URL}/admin/realms/{Config.KEYCLOAK_REALM}/users?username={username}"
-    headers = {"Authorization": f"Bearer {admin_token}"}
+    Returns:
+        The token claims, or None if the token is invalid or expired.
 
-    resp = requests.get(url, headers=headers)
-    if resp.status_code == 200:
-        users = resp.json()
-        # Keycloak search is fuzzy, so filter for exact match
-        for u in users:
-            if u['username'] == username:
-                return u['id']
-    return None
+    Raises:
+        JWTError if the token is not a JWT at all (opaque token), or if no
+        signing keys could be fetched.
+    """
+    header = jwt.get_unverified_header(token)
 
-def get_role_representation(admin_token, role_name):
-    url = f"{Config.KEYCLOAK_SERVER_URL}/admin/realms/{Config.KEYCLOAK_REALM}/roles/{role_name}"
-    headers = {"Authorization": f"Bearer {admin_token}"}
+    key = jwks_cache.get(header.get("kid"))
+    if key is None:
+        if not jwks_cache.loaded:
+            raise JWTError("No signing keys available")
+        return None
 
-    resp = requests.get(url, headers=headers)
-    if resp.status_code == 200:
-        return resp.json()
-    return None
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=Config.AUTH_JWT_ALGORITHMS,
+            issuer=Config.KEYCLOAK_ISSUER,
+            options={"verify_aud": False}
+        )
+    except JWTError:
+        return None
 
-def verify_token(token):
+    if claims.get("typ") != "Bearer" or claims.get("azp") != Config.KEYCLOAK_CLIENT_ID:
+        return None
+
+    claims["active"] = True
+    return claims
+
+def introspect_token(token):
     data = {
         "token": token,
         "client_id": Config.KEYCLOAK_CLIENT_ID,
         "client_secret": Config.KEYCLOAK_CLIENT_SECRET
     }
 
-    r = requests.post(Config.KEYCLOAK_INTROSPECT, data=data)
+    r = keycloak_request("POST", Config.KEYCLOAK_INTROSPECT, data=data)
 
     if r.status_code != 200:
         return None
@@ -74,6 +156,51 @@ def verify_token(token):
 
     return info
 
+def verify_token(token):
+    """
+    Validate an access token and return its claims (None if invalid).
+
+    In "jwt" mode tokens are verified locally; with AUTH_OPAQUE_FALLBACK set,
+    tokens that are not JWTs (or all tokens, while no signing keys could be
+    fetched) are introspected instead. In "introspect" mode
+    every token goes to Keycloak. Either way results are cached until the
+    token expires, so repeated requests with the same token skip all of it.
+    """
+    info = token_cache.get_token(token)
+    if info is not None:
+        return info
+
+    ttl = None
+    if Config.AUTH_VERIFY_MODE == "introspect":
+        info = introspect_token(token)
+        ttl = Config.AUTH_INTROSPECT_CACHE_TTL
+    else:
+        try:
+            info = verify_jwt_locally(token)
+        except JWTError:
+            if not Config.AUTH_OPAQUE_FALLBACK:
+                return None
+            info = introspect_token(token)
+            ttl = Config.AUTH_INTROSPECT_CACHE_TTL
+
+    if info is None:
+        return None
+
+    token_cache.put_token(token, info, ttl)
+    return info
+
+def bearer_user():
+    """
+    Claims of the request's bearer token, or None without a valid one.
+
+    Verifies the token like require_roles does (and shares its cache), so it
+    can run before require_roles, e.g. to rate limit by user.
+    """
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        return None
+    return verify_token(auth_header[len("Bearer "):])
+
 def require_roles(*roles):
     """
     Decorator to protect routes.
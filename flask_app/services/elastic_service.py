@@ -1,56 +1,316 @@
-from elasticsearch import Elasticsearch
+import re
+from datetime import datetime
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from database import LazyClient
 from config import Config
 
-# Initialize Elasticsearch client
-es_client = Elasticsearch([Config.ELASTICSEARCH_URL])
+# Initialize Elasticsearch client (on first use)
+es_client = LazyClient(lambda: Elasticsearch([Config.ELASTICSEARCH_URL]))
+
+# Searches and writes go through this alias; `flask reindex` builds a new
+# versioned index behind it and swaps the alias atomically
+TORRENTS_ALIAS = "torrents"
+
+INFO_HASH_PATTERN = re.compile(r"[0-9a-fA-F]{40}")
+
+# /search sort option -> document field
+SORT_FIELDS = {
+    "relevance": "_score",
+    "seeders": "seeders",
+    "created_at": "created_at",
+    "size": "file_size"
+}
+
+class PointInTimeExpired(Exception):
+    """Raised when a paginated search continues after its point in time was closed or expired."""
+
+# Applied to every torrents_* index through an index template (ensure_search_index).
+# Release names like "Some.Show.S01E02.1080p" are split on punctuation, case and
+# letter/digit changes (keeping the original token), and filename terms are also
+# indexed as edge n-grams so partial words match without wildcard queries.
+# Suggestions only split on punctuation, so "some show s01" completes the name.
+TORRENTS_INDEX_SETTINGS = {
+    "analysis": {
+        "tokenizer": {
+            "release_words": {
+                "type": "pattern",
+                "pattern": "[\\W_]+"
+            }
+        },
+        "filter": {
+            "release_split": {
+                "type": "word_delimiter",
+                "preserve_original": True
+            },
+            "release_split_search": {
+                "type": "word_delimiter_graph",
+                "preserve_original": True
+            },
+            "release_prefixes": {
+                "type": "edge_ngram",
+                "min_gram": 2,
+                "max_gram": 20,
+                "preserve_original": True
+            }
+        },
+        "analyzer": {
+            "release_name": {
+                "tokenizer": "whitespace",
+                "filter": ["release_split", "lowercase", "asciifolding", "release_prefixes"]
+            },
+            "release_name_search": {
+                "tokenizer": "whitespace",
+                "filter": ["release_split_search", "lowercase", "asciifolding"]
+            },
+            "release_suggest": {
+                "tokenizer": "release_words",
+                "filter": ["lowercase", "asciifolding"]
+            }
+        }
+    }
+}
+
+# Text fields keep term frequencies but no positions (no phrase queries are run),
+# fields that are only displayed are neither indexed nor given doc values, and
+# the sort/filter fields are numeric or date fields with doc values. "suggest"
+# is the in-memory completion structure behind /search/suggest, weighted by seeders.
+TORRENTS_MAPPINGS = {
+    "dynamic": False,
+    "properties": {
+        "id": {"type": "long"},
+        "info_hash": {"type": "keyword"},
+        "filename": {
+            "type": "text",
+            "analyzer": "release_name",
+            "search_analyzer": "release_name_search",
+            "index_options": "freqs"
+        },
+        "description": {"type": "text", "index_options": "freqs"},
+        "suggest": {"type": "completion", "analyzer": "release_suggest"},
+        "file_size": {"type": "long"},
+        "piece_length": {"type": "integer", "index": False, "doc_values": False},
+        "seeders": {"type": "integer"},
+        "leechers": {"type": "integer"},
+        "completed": {"type": "integer"},
+        "uploader_id": {"type": "integer"},
+        "created_at": {"type": "date"},
+        "updated_at": {"type": "date", "index": False}
+    }
+}
+
+def torrent_document(torrent):
+    """Build the ES document for a Torrent (or any row with the same attributes)."""
+    return {
+        "id": torrent.id,
+        "info_hash": torrent.info_hash,
+        "filename": torrent.filename,
+        "description": torrent.description,
+        "file_size": torrent.file_size,
+        "piece_length": torrent.piece_length,
+        "seeders": torrent.seeders,
+        "leechers": torrent.leechers,
+        "completed": torrent.completed,
+        "uploader_id": torrent.uploader_id,
+        "created_at": torrent.created_at.isoformat(),
+        "updated_at": torrent.updated_at.isoformat(),
+        "suggest": {"input": [torrent.filename], "weight": torrent.seeders or 0}
+    }
+
+def bulk_write(actions):
+    """
+    Send index/update/delete actions for the torrents index in one bulk request.
+
+    Args:
+        actions (list): helpers.bulk actions, "_id" being the torrent id
+
+    Returns:
+        dict mapping torrent id to an error message, for the actions that failed.
+        Updating or deleting a document that does not exist is not a failure.
+    """
+    if not actions:
+        return {}
 
-def index_torrent(torrent):
     try:
-        doc = {
-            "id": torrent.id,
-            "info_hash": torrent.info_hash,
-            "filename": torrent.filename,
-            "description": torrent.description,
-            "file_size": torrent.file_size,
-            "piece_length": torrent.piece_length,
-            "seeders": torrent.seeders,
-            "leechers": torrent.leechers,
-            "completed": torrent.completed,
-            "uploader_id": torrent.uploader_id,
-            "created_at": torrent.created_at.isoformat(),
-            "updated_at": torrent.updated_at.isoformat()
+        _, errors = helpers.bulk(es_client, actions, raise_on_error=False, raise_on_exception=False)
+    except Exception as e:
+        print(f"Bulk request with {len(actions)} actions failed: {e}")
+        return {int(action["_id"]): str(e) for action in actions}
+
+    failed = {}
+    for error in errors:
+        op_type, item = next(iter(error.items()))
+        if op_type in ("update", "delete") and item.get("status") == 404:
+            continue
+        failed[int(item["_id"])] = str(item.get("error", "unknown error"))
+    if failed:
+        print(f"{len(failed)} of {len(actions)} bulk actions failed")
+    return failed
+
+def aliased_indices():
+    """Concrete indices currently behind the torrents alias ([] if there is no alias)."""
+    if not es_client.indices.exists_alias(name=TORRENTS_ALIAS):
+        return []
+    return list(es_client.indices.get_alias(name=TORRENTS_ALIAS).keys())
+
+def create_versioned_index():
+    """
+    Create an empty torrents_<timestamp> index set up for bulk loading
+    (no replicas, no refreshes until finish_bulk_load).
+    """
+    index = f"{TORRENTS_ALIAS}_{datetime.utcnow():%Y%m%d%H%M%S}"
+    es_client.indices.create(index=index, settings={"number_of_replicas": 0, "refresh_interval": "-1"})
+    return index
+
+def finish_bulk_load(index: str):
+    """Restore the default replica count and refresh interval, then make everything searchable."""
+    es_client.indices.put_settings(index=index, settings={
+        "index": {"number_of_replicas": None, "refresh_interval": None}
+    })
+    es_client.indices.refresh(index=index)
+
+def swap_alias(index: str):
+    """
+    Point the torrents alias at `index` in one atomic alias update.
+
+    A concrete index named like the alias (created before aliases were used)
+    is deleted in the same update.
+
+    Returns:
+        Indices the alias was moved away from
+    """
+    previous = [name for name in aliased_indices() if name != index]
+
+    actions = [{"add": {"index": index, "alias": TORRENTS_ALIAS}}]
+    for name in previous:
+        actions.append({"remove": {"index": name, "alias": TORRENTS_ALIAS}})
+    if es_client.indices.exists(index=TORRENTS_ALIAS) and not es_client.indices.exists_alias(name=TORRENTS_ALIAS):
+        actions.append({"remove_index": {"index": TORRENTS_ALIAS}})
+
+    es_client.indices.update_aliases(actions=actions)
+    return previous
+
+def ensure_search_index():
+    """
+    Install the torrents index template and, on a fresh cluster, create the
+    first versioned index behind the alias so documents never end up in a
+    dynamically mapped index. Run by `flask migrate`.
+    """
+    es_client.indices.put_index_template(
+        name=TORRENTS_ALIAS,
+        index_patterns=[f"{TORRENTS_ALIAS}_*"],
+        template={"settings": TORRENTS_INDEX_SETTINGS, "mappings": TORRENTS_MAPPINGS}
+    )
+
+    if es_client.indices.exists_alias(name=TORRENTS_ALIAS):
+        return
+    if es_client.indices.exists(index=TORRENTS_ALIAS):
+        print(f"Index '{TORRENTS_ALIAS}' uses dynamic mapping; run `flask reindex` to move it to the explicit mapping")
+        return
+
+    index = f"{TORRENTS_ALIAS}_{datetime.utcnow():%Y%m%d%H%M%S}"
+    es_client.indices.create(index=index, aliases={TORRENTS_ALIAS: {}})
+
+def build_search_query(query: str):
+    """
+    Query for a search string. A full info hash is an exact keyword lookup;
+    anything else is a fuzzy match over the name and description only.
+    """
+    if INFO_HASH_PATTERN.fullmatch(query):
+        return {"constant_score": {"filter": {"term": {"info_hash": query.lower()}}}}
+
+    return {
+        "multi_match": {
+            "query": query,
+            "fields": ["filename^3", "description^2"],
+            "fuzziness": "AUTO",
+            "prefix_length": 1,
+            "max_expansions": 20
         }
+    }
+
+def build_search_filters(filters: dict):
+    """Range clauses for the /search filters (bool filter context, so they are cached)."""
+    clauses = []
+    size = {}
+    if "min_size" in filters:
+        size["gte"] = filters["min_size"]
+    if "max_size" in filters:
+        size["lte"] = filters["max_size"]
+    if size:
+        clauses.append({"range": {"file_size": size}})
+
+    created = {}
+    if "created_after" in filters:
+        created["gte"] = filters["created_after"]
+    if "created_before" in filters:
+        created["lte"] = filters["created_before"]
+    if created:
+        clauses.append({"range": {"created_at": created}})
 
-        es_client.index(index="torrents", id=torrent.id, body=doc)
-        return True
+    if "min_seeders" in filters:
+        clauses.append({"range": {"seeders": {"gte": filters["min_seeders"]}}})
+    return clauses
+
+def close_point_in_time(pit_id: str):
+    """Release a point in time early; failures are left to its keep-alive."""
+    try:
+        es_client.close_point_in_time(id=pit_id)
     except Exception as e:
-        print(f"Failed to index torrent {torrent.id}: {e}")
-        return False
+        print(f"Failed to close point in time: {e}")
 
-def search_torrents_elasticsearch(query: str, limit: int = 50):
+def search_torrents_elasticsearch(query: str, limit: int = 50, sort: str = "relevance", order: str = "desc",
+                                  filters: dict = None, pit_id: str = None, search_after=None):
     """
     Search for torrents in Elasticsearch by filename, description, or info_hash.
 
+    Pages after the first are read from a point in time, so results do not shift
+    while a client pages through them; the next page continues with search_after.
+    The point in time is opened with the first page (one round-trip that runs
+    no query) and closed again at once if that page is also the last.
+
     Args:
         query (str): Search string
         limit (int): Maximum number of results to return
+        sort (str): One of SORT_FIELDS
+        order (str): "asc" or "desc"
+        filters (dict): Parsed /search filters
+        pit_id, search_after: From the previous page, None for the first one
 
     Returns:
-        List of torrent results or empty list if no matches
+        dict with "results", and "pit_id"/"search_after" for the next page
+        (both None on the last page), or None if Elasticsearch is unavailable
+
+    Raises:
+        PointInTimeExpired if pit_id is no longer valid
     """
     try:
         search_body = {
             "size": limit,
             "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["filename^3", "description^2", "info_hash"],
-                    "fuzziness": "AUTO"
+                "bool": {
+                    "must": [build_search_query(query)],
+                    "filter": build_search_filters(filters or {})
                 }
-            }
+            },
+            # The point in time adds its own tiebreaker, so the sort is total
+            "sort": [{SORT_FIELDS[sort]: {"order": order}}],
+            "track_total_hits": False
         }
 
-        response = es_client.search(index="torrents", body=search_body)
+        opened_here = False
+        if pit_id is None and limit > 1 and INFO_HASH_PATTERN.fullmatch(query):
+            # An info hash matches one torrent at most, so there is no next page
+            response = es_client.search(index=TORRENTS_ALIAS, body=search_body)
+        else:
+            if pit_id is None:
+                pit_id = es_client.open_point_in_time(
+                    index=TORRENTS_ALIAS, keep_alive=Config.SEARCH_PIT_KEEP_ALIVE
+                )["id"]
+                opened_here = True
+            search_body["pit"] = {"id": pit_id, "keep_alive": Config.SEARCH_PIT_KEEP_ALIVE}
+            if search_after:
+                search_body["search_after"] = search_after
+            response = es_client.search(body=search_body)
 
         results = []
         for hit in response['hits']['hits']:
@@ -65,38 +325,56 @@ def search_torrents_elasticsearch(query: str, limit: int = 50):
                 "leechers": source.get('leechers'),
                 "completed": source.get('completed'),
                 "created_at": source.get('created_at'),
-                "score": round(hit['_score'], 2)
+                "score": round(hit['_score'], 2) if hit.get('_score') is not None else None
             })
 
-        return results
-    except Exception as e:
-        print(f"Elasticsearch search error: {e}")
-        return []
+        hits = response['hits']['hits']
+        if len(hits) < limit:
+            # A point in time handed out in a cursor is not closed on the last page:
+            # cached pages share it between clients, so it expires after
+            # SEARCH_PIT_KEEP_ALIVE. One just opened for a single page is closed now.
+            if opened_here:
+                close_point_in_time(response.get('pit_id') or pit_id)
+            return {"results": results, "pit_id": None, "search_after": None}
 
-def delete_torrent_index(torrent_id):
-    """Delete a torrent from Elasticsearch index."""
-    try:
-        es_client.delete(index="torrents", id=torrent_id)
-        return True
+        return {"results": results, "pit_id": response.get('pit_id', pit_id), "search_after": hits[-1]['sort']}
+    except NotFoundError as e:
+        if search_after:
+            raise PointInTimeExpired(str(e))
+        print(f"Elasticsearch search error: {e}")
+        return None
     except Exception as e:
-        print(f"Failed to delete torrent {torrent_id} from index: {e}")
-        return False
+        print(f"Elasticsearch search error: {e}")
+        return None
 
-def update_torrent_swarm_info(torrent_id, seeders: int, leechers: int, completed: int = None):
-    """Update swarm information for a torrent."""
-    try:
-        update_body = {
-            "doc": {
-                "seeders": seeders,
-                "leechers": leechers
-            }
-        }
+def suggest_torrents(prefix: str, size: int = 10):
+    """
+    Complete a partially typed torrent name from the completion suggester.
 
-        if completed is not None:
-            update_body["doc"]["completed"] = completed
+    Args:
+        prefix (str): What the user typed so far
+        size (int): Number of suggestions
 
-        es_client.update(index="torrents", id=torrent_id, body=update_body)
-        return True
+    Returns:
+        List of {id, filename, seeders}, best seeded first,
+        or None if Elasticsearch is unavailable
+    """
+    try:
+        response = es_client.search(
+            index=TORRENTS_ALIAS,
+            # Only the suggestions are wanted, not the hits of an implicit match_all
+            size=0,
+            suggest={"names": {"prefix": prefix, "completion": {
+                "field": "suggest", "size": size, "skip_duplicates": True
+            }}},
+            source=["id", "filename", "seeders"]
+        )
     except Exception as e:
-        print(f"Failed to update swarm info for torrent {torrent_id}: {e}")
-        return False
\ No newline at end of file
+        print(f"Elasticsearch suggest error: {e}")
+        return None
+
+    return [{
+        "id": option["_source"].get("id"),
+        "filename": option["_source"].get("filename"),
+        "seeders": option["_source"].get("seeders")
+    } for option in response["suggest"]["names"][0]["options"]]
@@ -0,0 +1,44 @@
+import time
+from sqlalchemy import text
+from database import db
+from services.redis_service import r
+from services.elastic_service import es_client
+from services.auth_service import jwks_cache
+from config import Config
+
+# Without these the app cannot serve; search falls back to Postgres without
+# Elasticsearch, and cached signing keys keep tokens verifiable while
+# Keycloak is away, so those two are only reported
+REQUIRED_DEPENDENCIES = ("postgres", "redis")
+
+def _check_keycloak():
+    if Config.AUTH_VERIFY_MODE == "jwt" and not jwks_cache.warm():
+        raise RuntimeError("signing keys not loaded")
+
+# Each check opens (and so warms) its client's connection pool
+CHECKS = {
+    "postgres": lambda: db.session.execute(text("SELECT 1")),
+    "redis": lambda: r.ping(),
+    "elasticsearch": lambda: es_client.options(request_timeout=Config.READINESS_TIMEOUT).info(),
+    "keycloak": _check_keycloak
+}
+
+def check_readiness():
+    """
+    Run every dependency check once.
+
+    Returns:
+        (ready, {dependency: {"ok", "ms", "error"}}); ready when the
+        REQUIRED_DEPENDENCIES are reachable
+    """
+    results = {}
+    for name, check in CHECKS.items():
+        started = time.perf_counter()
+        try:
+            check()
+            results[name] = {"ok": True}
+        except Exception as e:
+            results[name] = {"ok": False, "error": str(e)}
+        results[name]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    return all(results[name]["ok"] for name in REQUIRED_DEPENDENCIES), results
@@ -0,0 +1,182 @@
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from models import Torrent, db
+from services.torrent_file_service import parse_torrent_file
+from services.search_outbox_service import enqueue_index
+from services.swarm_service import register_torrents
+from services.search_cache_service import invalidate_search_cache
+from config import Config
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+_parse_pool = None
+
+def _get_parse_pool(workers: int):
+    # Created on first use so every (forked) process gets its own pool
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=workers)
+    return _parse_pool
+
+def _parse_entry(raw):
+    """Pool worker: parse one file, returning the column values or an error message."""
+    if raw is None:
+        return f"file is larger than {Config.BULK_UPLOAD_MAX_FILE_SIZE} bytes"
+    try:
+        return parse_torrent_file(raw)
+    except ValueError as e:
+        return str(e)
+    except Exception as e:
+        # Anything else is still this file's problem, not the upload's
+        return f"could not parse torrent: {e!r}"
+
+def _read_limited(fileobj):
+    """Read at most BULK_UPLOAD_MAX_FILE_SIZE bytes; None if the file is bigger."""
+    data = fileobj.read(Config.BULK_UPLOAD_MAX_FILE_SIZE + 1)
+    return None if len(data) > Config.BULK_UPLOAD_MAX_FILE_SIZE else data
+
+def iter_archive(fileobj, name: str):
+    """
+    Yield (name, raw bytes) for every .torrent inside a tar or zip archive.
+
+    Tar archives are read as a stream (fileobj does not need to be seekable);
+    zip archives need a seekable file.
+    """
+    if name.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.endswith(".torrent"):
+                    continue
+                with archive.open(member) as f:
+                    yield member.filename, _read_limited(f)
+        return
+
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith(".torrent"):
+                continue
+            yield member.name, _read_limited(archive.extractfile(member))
+
+def iter_uploads(files):
+    """Yield (name, raw bytes) for uploaded files, expanding archives."""
+    for f in files:
+        name = f.filename or ""
+        if name.lower().endswith(TAR_SUFFIXES) or name.lower().endswith(".zip"):
+            yield from iter_archive(f.stream, name)
+        else:
+            yield name, _read_limited(f.stream)
+
+def _ingest_batch(batch, description: str, uploader_id: int, workers: int):
+    raws = [raw for _, raw in batch]
+    if workers > 1:
+        parsed = _get_parse_pool(workers).map(_parse_entry, raws, chunksize=16)
+    else:
+        parsed = map(_parse_entry, raws)
+
+    report = []
+    pending = {}
+    for (name, _), fields in zip(batch, parsed):
+        result = {"file": name}
+        report.append(result)
+
+        if isinstance(fields, str):
+            result["status"] = "invalid"
+            result["error"] = fields
+            continue
+
+        result["info_hash"] = fields["info_hash"]
+        if fields["info_hash"] in pending:
+            result["status"] = "duplicate"
+            result["error"] = "Same torrent appears earlier in this upload"
+            continue
+        pending[fields["info_hash"]] = (result, fields)
+
+    if not pending:
+        return report
+
+    # One query per batch to drop torrents we already have
+    existing = set(db.session.scalars(
+        select(Torrent.info_hash).where(Torrent.info_hash.in_(pending.keys()))
+    ))
+
+    rows = []
+    for info_hash, (result, fields) in pending.items():
+        if info_hash in existing:
+            result["status"] = "duplicate"
+            result["error"] = "Torrent already exists"
+            continue
+        rows.append(dict(
+            fields,
+            description=description,
+            uploader_id=uploader_id,
+            seeders=0,
+            leechers=0,
+            completed=0
+        ))
+
+    if not rows:
+        return report
+
+    # executemany-style insert (batched multi-row VALUES); rows that a concurrent
+    # upload inserted in the meantime are skipped instead of failing the batch
+    statement = insert(Torrent).on_conflict_do_nothing(index_elements=["info_hash"]).returning(Torrent.id, Torrent.info_hash)
+    try:
+        inserted = db.session.execute(statement, rows).all()
+        # Indexed in bulk by the search worker
+        enqueue_index([torrent.id for torrent in inserted])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for row in rows:
+            result = pending[row["info_hash"]][0]
+            result["status"] = "error"
+            result["error"] = f"Database insert failed: {e}"
+        return report
+
+    inserted_hashes = set()
+    for torrent in inserted:
+        result = pending[torrent.info_hash][0]
+        result["status"] = "created"
+        result["torrent_id"] = torrent.id
+        inserted_hashes.add(torrent.info_hash)
+
+    for row in rows:
+        if row["info_hash"] not in inserted_hashes:
+            result = pending[row["info_hash"]][0]
+            result["status"] = "duplicate"
+            result["error"] = "Torrent already exists"
+
+    register_torrents([bytes.fromhex(info_hash) for info_hash in inserted_hashes])
+    if inserted_hashes:
+        invalidate_search_cache()
+
+    return report
+
+def ingest_torrents(entries, description: str = "", uploader_id: int = 1, batch_size: int = None,
+                    workers: int = None):
+    """
+    Parse, dedupe, insert and index many .torrent files.
+
+    Args:
+        entries: iterable of (name, raw bytes or None if oversized)
+        workers: Processes parsing the files, 1 to parse in the calling thread
+            (default BULK_UPLOAD_WORKERS)
+
+    Yields:
+        Per-file report dicts (file, status, info_hash, torrent_id, error),
+        one batch at a time
+    """
+    batch_size = batch_size or Config.BULK_UPLOAD_BATCH_SIZE
+    workers = workers or Config.BULK_UPLOAD_WORKERS
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield from _ingest_batch(batch, description, uploader_id, workers)
+            batch = []
+
+    if batch:
+        yield from _ingest_batch(batch, description, uploader_id, workers)
@@ -0,0 +1,214 @@
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+
+# Every call to Keycloak goes through this session so connections are pooled and kept alive.
+# Idempotent requests are retried on connection errors and 502/503/504; POSTs only on
+# connection errors (nothing reached Keycloak, so they are safe to resend).
+def _build_session():
+    retry = Retry(
+        total=Config.KEYCLOAK_HTTP_RETRIES,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "PUT", "DELETE", "HEAD", "OPTIONS"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=Config.KEYCLOAK_POOL_SIZE,
+        pool_maxsize=Config.KEYCLOAK_POOL_SIZE,
+        max_retries=retry
+    )
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+session = _build_session()
+
+def keycloak_request(method: str, url: str, **kwargs):
+    """session.request with the configured timeout applied."""
+    kwargs.setdefault("timeout", Config.KEYCLOAK_HTTP_TIMEOUT)
+    return session.request(method, url, **kwargs)
+
+def admin_url(path: str) -> str:
+    return f"{Config.KEYCLOAK_SERVER_URL.rstrip('/')}/admin/realms/{Config.KEYCLOAK_REALM}{path}"
+
+_admin_token = {"value": None, "expires_at": 0}
+_admin_token_lock = threading.Lock()
+
+def get_admin_token(force_refresh: bool = False) -> str:
+    """
+    Admin access token for the realm, reused until shortly before it expires.
+    """
+    if not force_refresh and _admin_token["expires_at"] > time.time():
+        return _admin_token["value"]
+
+    with _admin_token_lock:
+        # Another thread may have refreshed it while we waited
+        if not force_refresh and _admin_token["expires_at"] > time.time():
+            return _admin_token["value"]
+
+        url = Config.KEYCLOAK_SERVER_URL.rstrip('/') + "/realms/master/protocol/openid-connect/token"
+        payload = {
+            "client_id": "admin-cli",
+            "username": Config.KEYCLOAK_ADMIN_USER,
+            "password": Config.KEYCLOAK_ADMIN_PASSWORD,
+            "grant_type": "password"
+        }
+
+        response = keycloak_request("POST", url, data=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        _admin_token["value"] = data["access_token"]
+        _admin_token["expires_at"] = time.time() + data.get("expires_in", 60) - Config.KEYCLOAK_ADMIN_TOKEN_MARGIN
+        return _admin_token["value"]
+
+def admin_request(method: str, url: str, **kwargs):
+    """
+    Call the admin API with the cached admin token.
+
+    A 401 means the token was revoked or expired early; it is refreshed and the
+    call retried once.
+    """
+    headers = kwargs.pop("headers", {})
+
+    for attempt in range(2):
+        headers["Authorization"] = f"Bearer {get_admin_token(force_refresh=attempt > 0)}"
+        response = keycloak_request(method, url, headers=headers, **kwargs)
+        if response.status_code != 401:
+            break
+    return response
+
+class TTLCache:
+    """Small thread-safe map with per-entry expiry, evicting least recently used entries beyond max_size."""
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, ttl: float = None):
+        with self._lock:
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_role_cache = TTLCache(100, Config.KEYCLOAK_ROLE_CACHE_TTL)
+_user_id_cache = TTLCache(10000, Config.KEYCLOAK_USER_ID_CACHE_TTL)
+
+def get_user_id(username: str):
+    """Keycloak id of a user (cached), or None if Keycloak has no such user."""
+    user_id = _user_id_cache.get(username)
+    if user_id is not None:
+        return user_id
+
+    resp = admin_request("GET", admin_url("/users"), params={"username": username, "exact": "true"})
+    if resp.status_code == 200:
+        # Older Keycloak versions ignore "exact" and search fuzzily, so filter for an exact match
+        for u in resp.json():
+            if u['username'] == username:
+                _user_id_cache.put(username, u['id'])
+                return u['id']
+    return None
+
+def get_role_representation(role_name: str):
+    """Realm role representation (cached), or None if the role does not exist."""
+    role = _role_cache.get(role_name)
+    if role is not None:
+        return role
+
+    resp = admin_request("GET", admin_url(f"/roles/{role_name}"))
+    if resp.status_code == 200:
+        role = resp.json()
+        _role_cache.put(role_name, role)
+        return role
+    return None
+
+def create_user(payload: dict):
+    return admin_request("POST", admin_url("/users"), json=payload)
+
+def delete_user(location: str):
+    """Delete a user by the Location URL returned from create_user."""
+    return admin_request("DELETE", location)
+
+def replace_realm_role(kc_user_id: str, new_role_rep: dict, old_role_rep: dict = None):
+    """
+    Swap a user's realm role mapping.
+
+    Returns:
+        Response of the final mapping call
+    """
+    mapping_url = admin_url(f"/users/{kc_user_id}/role-mappings/realm")
+
+    if old_role_rep:
+        admin_request("DELETE", mapping_url, json=[old_role_rep])
+
+    return admin_request("POST", mapping_url, json=[new_role_rep])
+
+def bulk_replace_realm_roles(changes, max_workers: int = None):
+    """
+    Apply many role changes with bounded parallelism.
+
+    The admin token and every role representation involved are fetched once
+    up front; the per-user lookups and mapping calls then run concurrently
+    over the pooled session.
+
+    Args:
+        changes (list): (username, old_role, new_role) tuples
+
+    Returns:
+        dict mapping username to None on success or an error message
+    """
+    get_admin_token()
+
+    roles = {}
+    for _, old_role, new_role in changes:
+        for role_name in (old_role, new_role):
+            if role_name and role_name not in roles:
+                roles[role_name] = get_role_representation(role_name)
+
+    def apply(change):
+        username, old_role, new_role = change
+        if not roles.get(new_role):
+            return f"Role '{new_role}' does not exist in Keycloak settings"
+        try:
+            kc_user_id = get_user_id(username)
+            if not kc_user_id:
+                return "Sync Error: User found locally but not in Keycloak"
+
+            resp = replace_realm_role(kc_user_id, roles[new_role], roles.get(old_role))
+            if resp.status_code not in [204, 200]:
+                return f"Failed to update Keycloak role: {resp.text}"
+        except requests.RequestException as e:
+            return f"Backend connection failed: {e}"
+        except Exception as e:
+            # Reported for this user only: others may already have been changed
+            return f"Unexpected Keycloak response: {e}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=max_workers or Config.KEYCLOAK_BULK_CONCURRENCY) as executor:
+        results = executor.map(apply, changes)
+        return {change[0]: error for change, error in zip(changes, results)}
@@ -0,0 +1,89 @@
+import threading
+import time
+import redis
+from database import db, pool_wait_stats, POOL_WAIT_BUCKETS_MS
+from services.redis_service import r
+from config import Config
+
+# Checkout wait counters of every process of every replica, summed
+POOL_METRICS_KEY = "db:pool:metrics"
+
+BUCKET_FIELDS = [f"le_{bound}" for bound in POOL_WAIT_BUCKETS_MS] + ["le_inf"]
+
+_publish_lock = threading.Lock()
+_last_publish = 0.0
+
+def _publish(counters: dict):
+    try:
+        pipe = r.pipeline(transaction=False)
+        for field, value in counters.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(POOL_METRICS_KEY, field, value)
+            else:
+                pipe.hincrby(POOL_METRICS_KEY, field, value)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Failed to record pool metrics: {e}")
+    finally:
+        _publish_lock.release()
+
+def publish_pool_metrics(exception=None):
+    """
+    Add this process's checkout waits to POOL_METRICS_KEY, at most once every
+    DB_POOL_METRICS_INTERVAL seconds.
+
+    Runs on app context teardown, which is still part of the request (before the
+    server writes the body), so the Redis call is made from a short-lived
+    background thread instead.
+    """
+    global _last_publish
+    now = time.monotonic()
+    if now - _last_publish < Config.DB_POOL_METRICS_INTERVAL or not _publish_lock.acquire(blocking=False):
+        return
+    _last_publish = now
+    counters = pool_wait_stats.drain()
+    if not counters:
+        _publish_lock.release()
+        return
+    threading.Thread(target=_publish, args=(counters,), daemon=True).start()
+
+def _percentile(buckets: list, total: int, fraction: float):
+    """Upper bound (ms) of the bucket holding the given percentile, None if above the last bound."""
+    seen = 0
+    for bound, count in zip(POOL_WAIT_BUCKETS_MS, buckets):
+        seen += count
+        if seen >= total * fraction:
+            return bound
+    return None
+
+def get_pool_metrics():
+    """
+    Checkout wait times across all processes since the last reset, and the
+    pool of the process answering.
+    """
+    counters = {key.decode(): value for key, value in r.hgetall(POOL_METRICS_KEY).items()}
+    checkouts = int(counters.get("checkouts", 0))
+    buckets = [int(counters.get(field, 0)) for field in BUCKET_FIELDS]
+    wait_ms_total = float(counters.get("wait_ms_total", 0))
+
+    pool = db.engine.pool
+    return {
+        "checkouts": checkouts,
+        "timeouts": int(counters.get("timeouts", 0)),
+        "wait_ms_avg": round(wait_ms_total / checkouts, 3) if checkouts else None,
+        # Percentiles are bucket upper bounds
+        "wait_ms_p50": _percentile(buckets, checkouts, 0.5) if checkouts else None,
+        "wait_ms_p95": _percentile(buckets, checkouts, 0.95) if checkouts else None,
+        "wait_ms_p99": _percentile(buckets, checkouts, 0.99) if checkouts else None,
+        "histogram": dict(zip(BUCKET_FIELDS, buckets)),
+        "process_pool": {
+            "size": pool.size(),
+            "max_overflow": Config.DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "pgbouncer": Config.DB_PGBOUNCER
+        }
+    }
+
+def reset_pool_metrics():
+    r.delete(POOL_METRICS_KEY)
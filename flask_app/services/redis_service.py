@@ -1,66 +1,321 @@
 import redis
+import threading
 import time
-import uuid
+from collections import OrderedDict
 from functools import wraps
-from flask import request, jsonify
+from redis.commands.core import Script
+from flask import request, jsonify, g
+from services.auth_service import bearer_user
+from database import LazyClient
 from config import Config
 
-# Connect to Redis container
-r = redis.from_url(Config.REDIS_URL)
+# Connect to Redis container (on first use)
+r = LazyClient(lambda: redis.from_url(Config.REDIS_URL))
 
-def rate_limit(limit=10, window=60):
+def register_script(script: str) -> Script:
     """
-    Sliding Window Rate Limiter using Redis Sorted Sets (ZSET).
+    r.register_script without creating the client: given as bytes, the
+    script's SHA1 needs no encoder from it.
+    """
+    return Script(r, script.encode())
+
+RATE_LIMIT_ALGORITHMS = ("sliding_log", "sliding_counter", "gcra")
+
+# Hash of limit overrides set with `flask rate-limit --set`, read by the limiter
+# script on every check: field "<bucket>" applies to every client of a bucket,
+# "<bucket>:<client>" to one client; values are "<limit>/<window seconds>"
+RATE_LIMIT_OVERRIDES_KEY = "rate_limit:overrides"
+
+# One round-trip per check. Time comes from the Redis server so every replica
+# sees the same clock. Rejected requests are never recorded, so a client that
+# stops sending regains its quota on schedule. `served` requests that the
+# local tier (LocalRateLimiter) already let through are recorded first, then
+# the current request is checked.
+#
+# KEYS[1] client key, KEYS[2] RATE_LIMIT_OVERRIDES_KEY
+# ARGV: algorithm, limit, window (seconds), bucket, client, served
+# Returns {allowed (0/1), limit, remaining, milliseconds until the next request is allowed,
+#          window in seconds} (limit and window after overrides)
+RATE_LIMIT_SCRIPT = """
+local algorithm = ARGV[1]
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3]) * 1000
+local served = tonumber(ARGV[6]) or 0
+
+local override = redis.call('HGET', KEYS[2], ARGV[4] .. ':' .. ARGV[5]) or redis.call('HGET', KEYS[2], ARGV[4])
+if override then
+    local l, w = string.match(override, '^(%d+)/(%d+)$')
+    if l then
+        limit = tonumber(l)
+        window = tonumber(w) * 1000
+    end
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+if algorithm == 'sliding_log' then
+    -- One member per accepted request within the window
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+    local count = redis.call('ZCARD', KEYS[1])
+    -- Members only need to be unique: the time plus the count at that time is
+    for i = 1, served do
+        redis.call('ZADD', KEYS[1], now, now .. ':' .. count)
+        count = count + 1
+    end
+    if served > 0 then
+        redis.call('PEXPIRE', KEYS[1], window)
+    end
+    if count >= limit then
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+        local retry = oldest[2] and (tonumber(oldest[2]) + window - now) or window
+        return {0, limit, 0, retry, window / 1000}
+    end
+    redis.call('ZADD', KEYS[1], now, now .. ':' .. count)
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, limit, limit - count - 1, 0, window / 1000}
+
+elseif algorithm == 'sliding_counter' then
+    -- Counts of the current and previous fixed window; the previous one is
+    -- weighted by how much of it still overlaps the sliding window
+    local current = math.floor(now / window)
+    local state = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+    local count, previous = 0, 0
+    if tonumber(state[1]) == current then
+        count, previous = tonumber(state[2]), tonumber(state[3])
+    elseif tonumber(state[1]) == current - 1 then
+        previous = tonumber(state[2])
+    end
+    count = count + served
+    local overlap = 1 - (now - current * window) / window
+    local estimate = previous * overlap + count
+    if estimate + 1 > limit then
+        -- When enough of the previous window has slid out, or else enough of
+        -- this one once it has become the previous window
+        local retry = (current + 1) * window - now + math.ceil(math.max(0, 1 - (limit - 1) / count) * window)
+        if previous > 0 and count < limit then
+            retry = math.min(retry, math.ceil((estimate + 1 - limit) / previous * window))
+        end
+        if served > 0 then
+            redis.call('HSET', KEYS[1], 'w', current, 'c', count, 'p', previous)
+            redis.call('PEXPIRE', KEYS[1], 2 * window)
+        end
+        return {0, limit, 0, retry, window / 1000}
+    end
+    redis.call('HSET', KEYS[1], 'w', current, 'c', count + 1, 'p', previous)
+    redis.call('PEXPIRE', KEYS[1], 2 * window)
+    return {1, limit, math.floor(limit - estimate - 1), 0, window / 1000}
+
+else
+    -- GCRA: one theoretical arrival time per client; requests are spaced
+    -- window / limit apart, with bursts of up to `limit`
+    local interval = window / limit
+    local tat = tonumber(redis.call('GET', KEYS[1])) or now
+    tat = math.max(tat, now) + served * interval
+    local allow_at = tat + interval - window
+    if now < allow_at then
+        if served > 0 then
+            redis.call('SET', KEYS[1], math.ceil(tat), 'PX', math.ceil(tat - now))
+        end
+        return {0, limit, 0, math.ceil(allow_at - now), window / 1000}
+    end
+    local new_tat = tat + interval
+    redis.call('SET', KEYS[1], math.ceil(new_tat), 'PX', math.ceil(new_tat - now))
+    return {1, limit, math.floor((window - (new_tat - now)) / interval), 0, window / 1000}
+end
+"""
+
+_rate_limit_script = register_script(RATE_LIMIT_SCRIPT)
+
+def rate_limit_client():
+    """
+    Identity requests are counted under: the client IP (see
+    Config.TRUSTED_PROXY_COUNT), or with RATE_LIMIT_BY_USER the token subject
+    of signed-in users.
+    """
+    if Config.RATE_LIMIT_BY_USER:
+        # rate_limit usually runs before require_roles has set g.user, so the
+        # token is verified here; a process that has not seen it yet must not
+        # count it under the client IP instead
+        user = g.get("user") or bearer_user()
+        if user and user.get("sub"):
+            return f"user:{user['sub']}"
+    return request.remote_addr
+
+def check_rate_limit(bucket: str, client: str, limit: int, window: int, algorithm: str = None, served: int = 0):
+    """
+    Count one request of `client` in `bucket` and decide whether it is allowed.
 
     Args:
-        limit (int): Max requests allowed.
-        window (int): Time window in seconds.
+        bucket (str): Name of the limit ("default" is shared by most routes)
+        client (str): Who is being limited
+        limit (int): Max requests allowed, unless overridden in RATE_LIMIT_OVERRIDES_KEY
+        window (int): Time window in seconds
+        algorithm (str): One of RATE_LIMIT_ALGORITHMS, Config.RATE_LIMIT_ALGORITHM by default
+        served (int): Earlier requests let through without asking Redis, recorded first
+
+    Returns:
+        (allowed, limit, window, remaining, seconds until the next request is allowed),
+        limit and window being the ones that applied
     """
-    def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            try:
-                ip = request.remote_addr
-                key = f"rate_limit:{ip}"
+    algorithm = algorithm or Config.RATE_LIMIT_ALGORITHM
+    key = f"rate_limit:{algorithm}:{bucket}:{client}"
+    allowed, limit, remaining, retry_ms, window = _rate_limit_script(
+        keys=[key, RATE_LIMIT_OVERRIDES_KEY], args=[algorithm, limit, window, bucket, client, served]
+    )
+    return bool(allowed), int(limit), int(window), int(remaining), int(retry_ms) / 1000
+
+def set_rate_limit_override(bucket: str, limit: int, window: int, client: str = None):
+    field = f"{bucket}:{client}" if client else bucket
+    r.hset(RATE_LIMIT_OVERRIDES_KEY, field, f"{limit}/{window}")
 
-                now = time.time()
-                window_start = now - window
+def remove_rate_limit_override(bucket: str, client: str = None):
+    return bool(r.hdel(RATE_LIMIT_OVERRIDES_KEY, f"{bucket}:{client}" if client else bucket))
 
-                pipe = r.pipeline()
+def get_rate_limit_overrides():
+    return {field.decode(): value.decode() for field, value in r.hgetall(RATE_LIMIT_OVERRIDES_KEY).items()}
 
-                # Remove all requests older than the window start
-                pipe.zremrangebyscore(key, 0, window_start)
+class _LocalEntry:
+    """What one process knows about one client in one bucket."""
+    __slots__ = ("limit", "window", "tokens", "refilled_at", "blocked_until", "remaining", "unsynced", "synced_at")
 
-                # Add the current request
-                request_id = f"{now}:{uuid.uuid4()}"
-                pipe.zadd(key, {request_id: now})
+    def __init__(self, limit, window, now):
+        self.limit = limit
+        self.window = window
+        # Token bucket of the requests this process let through
+        self.tokens = float(limit)
+        self.refilled_at = now
+        self.blocked_until = 0.0
+        # Quota left according to Redis at synced_at, and requests let through since
+        self.remaining = 0
+        self.unsynced = 0
+        self.synced_at = None
 
-                # Count how many requests are currently in the set (the window)
-                pipe.zcard(key)
+class LocalRateLimiter:
+    """
+    In-process tier in front of the Redis limiter, answering without Redis
+    when the outcome is clear:
+
+    - a client Redis rejected stays rejected until its retry time;
+    - a client whose token bucket in this process alone is empty is over its
+      limit everywhere;
+    - a client far from its limit may use `share` of the quota Redis last
+      reported, for up to `sync_interval` seconds. Those requests are recorded
+      in Redis by the next check.
+
+    Only requests near the threshold go to Redis. While Redis is unreachable
+    the token buckets limit every process on its own. Entries are kept in an
+    LRU of `max_entries` clients.
+    """
+
+    def __init__(self, max_entries: int, share: float, sync_interval: float, redis_retry: float = 1.0):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.share = share
+        self.sync_interval = sync_interval
+        self.redis_retry = redis_retry
+        self.redis_down_until = 0.0
+        self.stats = {"local_allowed": 0, "local_rejected": 0, "redis_checks": 0, "redis_errors": 0}
+
+    def check(self, bucket: str, client: str, limit: int, window: int, algorithm: str = None):
+        """
+        Count one request, like check_rate_limit.
+
+        Returns:
+            (allowed, limit, window, seconds until the next request is allowed)
+        """
+        now = time.monotonic()
+        key = (bucket, client, algorithm)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _LocalEntry(limit, window, now)
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+
+            entry.tokens = min(entry.limit, entry.tokens + (now - entry.refilled_at) * entry.limit / entry.window)
+            entry.refilled_at = now
+
+            if now < entry.blocked_until or entry.tokens < 1:
+                self.stats["local_rejected"] += 1
+                retry_after = max(entry.blocked_until - now, (1 - entry.tokens) * entry.window / entry.limit)
+                return False, entry.limit, entry.window, retry_after
+
+            fresh = entry.synced_at is not None and now - entry.synced_at < self.sync_interval
+            if now < self.redis_down_until or (fresh and entry.unsynced + 1 <= entry.remaining * self.share):
+                entry.tokens -= 1
+                entry.unsynced += 1
+                self.stats["local_allowed"] += 1
+                return True, entry.limit, entry.window, 0
 
-                # Set the key to expire slightly after the window (auto-cleanup)
-                pipe.expire(key, window + 1)
+            # Requests let through during an outage are reported up to one full limit
+            served = min(entry.unsynced, entry.limit)
+            entry.unsynced = 0
 
-                # Execute pipeline
-                results = pipe.execute()
+        try:
+            allowed, limit, window, remaining, retry_after = check_rate_limit(
+                bucket, client, limit, window, algorithm, served
+            )
+        except redis.RedisError as e:
+            print(f"Warning: Redis unavailable, rate limiting locally: {e}")
+            with self.lock:
+                self.stats["redis_errors"] += 1
+                self.redis_down_until = now + self.redis_retry
+                entry.tokens -= 1
+                entry.unsynced += served + 1
+            return True, entry.limit, entry.window, 0
 
-                # results[0] = number of removed items
-                # results[1] = number of added items (always 1)
-                # results[2] = current count (ZCARD result)
-                current_request_count = results[2]
+        with self.lock:
+            self.stats["redis_checks"] += 1
+            # Overrides may have changed the limit
+            entry.limit, entry.window = limit, window
+            entry.tokens = min(entry.tokens, limit)
+            entry.remaining = remaining
+            entry.synced_at = now
+            if allowed:
+                entry.tokens -= 1
+            else:
+                entry.blocked_until = now + retry_after
+        return allowed, limit, window, retry_after
 
-                # Check against limit
-                if current_request_count > limit:
-                    return jsonify({
-                        "error": "Too many requests",
-                        "message": f"Limit is {limit} requests per {window} seconds."
-                    }), 429
+local_rate_limiter = LocalRateLimiter(
+    Config.RATE_LIMIT_LOCAL_ENTRIES, Config.RATE_LIMIT_LOCAL_SHARE, Config.RATE_LIMIT_LOCAL_SYNC_INTERVAL
+)
+
+def rate_limit(limit=10, window=60, bucket=None, algorithm=None):
+    """
+    Rate limiter: the local tier (local_rate_limiter) answers clear cases,
+    the rest cost one Redis script call.
+
+    Args:
+        limit (int): Max requests allowed.
+        window (int): Time window in seconds.
+        bucket (str): Count these requests separately from the shared per-client window.
+        algorithm (str): One of RATE_LIMIT_ALGORITHMS, Config.RATE_LIMIT_ALGORITHM by default.
+    """
+    if algorithm is not None and algorithm not in RATE_LIMIT_ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # If Redis is down, the local tier limits each process on its own
+            allowed, effective_limit, effective_window, retry_after = local_rate_limiter.check(
+                bucket or "default", rate_limit_client(), limit, window, algorithm
+            )
 
-            except redis.ConnectionError:
-                # If Redis is down, allow the request
-                print("Warning: Redis connection failed, rate limiting skipped.")
-                pass
+            if not allowed:
+                response = jsonify({
+                    "error": "Too many requests",
+                    "message": f"Limit is {effective_limit} requests per {effective_window} seconds."
+                })
+                response.headers["Retry-After"] = str(max(int(retry_after + 0.999), 1))
+                return response, 429
 
             return f(*args, **kwargs)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,183 @@
+import time
+from elasticsearch import helpers
+from sqlalchemy import select
+from models import Torrent, db
+from services.elastic_service import (
+    es_client, torrent_document, create_versioned_index, finish_bulk_load, swap_alias
+)
+from services.search_outbox_service import (
+    DOCUMENT_COLUMNS, pause_outbox, refresh_outbox_pause, resume_outbox, outbox_paused
+)
+from services.search_cache_service import invalidate_search_cache
+from services.redis_service import r
+from config import Config
+
+# Progress of a running or interrupted reindex: target index, last copied torrent id
+# and how many documents were copied so far
+REINDEX_STATE_KEY = "search:reindex"
+# Torrent ids whose bulk action failed; retried before the alias is swapped
+REINDEX_FAILED_KEY = "search:reindex:failed"
+
+class ReindexError(Exception):
+    """Raised when the new index could not be completed; the alias is left untouched."""
+
+def get_reindex_state():
+    state = r.hgetall(REINDEX_STATE_KEY)
+    if not state:
+        return None
+    return {
+        "index": state[b"index"].decode(),
+        "last_id": int(state[b"last_id"]),
+        "copied": int(state[b"copied"])
+    }
+
+def abort_reindex(log=print):
+    """Drop the partially built index and let the search worker continue."""
+    state = get_reindex_state()
+    if state:
+        es_client.indices.delete(index=state["index"], ignore_unavailable=True)
+        log(f"Deleted partial index {state['index']}")
+    r.delete(REINDEX_STATE_KEY, REINDEX_FAILED_KEY)
+    resume_outbox()
+
+def _keep_paused():
+    if not refresh_outbox_pause():
+        raise ReindexError(
+            "The search outbox pause lapsed and queued writes went to the current index; "
+            "run the command again to start over"
+        )
+
+def _copy_rows(index: str, last_id: int, batch_size: int, threads: int):
+    """
+    Yield (torrent id, ok) for every torrent after last_id, in id order.
+
+    Rows come from a server-side cursor (yield_per), so memory stays flat;
+    parallel_bulk keeps `threads` bulk requests in flight and reports the
+    results in the order the actions were produced.
+    """
+    rows = db.session.execute(
+        select(*DOCUMENT_COLUMNS)
+        .where(Torrent.id > last_id)
+        .order_by(Torrent.id)
+        .execution_options(yield_per=batch_size)
+    )
+    actions = ({"_index": index, "_id": row.id, "_source": torrent_document(row)} for row in rows)
+
+    for ok, item in helpers.parallel_bulk(es_client, actions, thread_count=threads, chunk_size=batch_size,
+                                          raise_on_error=False, raise_on_exception=False):
+        yield int(item["index"]["_id"]), ok
+
+def _retry_failed(index: str, batch_size: int):
+    """Index the torrents recorded in REINDEX_FAILED_KEY once more. Returns how many still fail."""
+    failed_ids = [int(torrent_id) for torrent_id in r.smembers(REINDEX_FAILED_KEY)]
+    still_failing = 0
+
+    for start in range(0, len(failed_ids), batch_size):
+        chunk = failed_ids[start:start + batch_size]
+        rows = db.session.execute(select(*DOCUMENT_COLUMNS).where(Torrent.id.in_(chunk))).all()
+        actions = [{"_index": index, "_id": row.id, "_source": torrent_document(row)} for row in rows]
+
+        _, errors = helpers.bulk(es_client, actions, raise_on_error=False, raise_on_exception=False)
+        errored = {int(next(iter(error.values()))["_id"]) for error in errors}
+
+        # Rows deleted in the meantime need no document
+        done = [torrent_id for torrent_id in chunk if torrent_id not in errored]
+        if done:
+            r.srem(REINDEX_FAILED_KEY, *done)
+        still_failing += len(errored)
+        _keep_paused()
+
+    return still_failing
+
+def reindex_torrents(batch_size: int = None, threads: int = None, restart: bool = False,
+                     keep_old: bool = False, log=print):
+    """
+    Rebuild the torrents index from Postgres without search downtime.
+
+    Every row is copied into a new versioned index while searches keep using
+    the current one; the alias is then swapped atomically. The search outbox
+    is paused for the duration, so changes made meanwhile are queued and
+    applied to the new index after the swap. Progress is checkpointed in
+    Redis: running the command again after an interruption continues where
+    it stopped, unless the pause lapsed in between (SEARCH_OUTBOX_PAUSE_TTL).
+
+    Returns:
+        Name of the new index
+    """
+    batch_size = batch_size or Config.SEARCH_REINDEX_BATCH_SIZE
+    threads = threads or Config.SEARCH_REINDEX_THREADS
+
+    state = get_reindex_state()
+    if state and restart:
+        abort_reindex(log)
+        state = None
+    if state and not es_client.indices.exists(index=state["index"]):
+        log(f"Index {state['index']} of the interrupted reindex is gone, starting over")
+        r.delete(REINDEX_STATE_KEY, REINDEX_FAILED_KEY)
+        state = None
+    if state and not outbox_paused():
+        # Queued writes were applied to the current index only since the pause
+        # lapsed, so the documents copied so far may be stale
+        log(f"The search outbox was resumed after the reindex into {state['index']} stopped, starting over")
+        abort_reindex(log)
+        state = None
+
+    if state:
+        log(f"Resuming reindex into {state['index']} after torrent {state['last_id']} "
+            f"({state['copied']} already copied)")
+    else:
+        state = {"index": create_versioned_index(), "last_id": 0, "copied": 0}
+        r.hset(REINDEX_STATE_KEY, mapping=state)
+        log(f"Reindexing into {state['index']}")
+
+    index = state["index"]
+    pause_outbox(f"reindex into {index}")
+
+    started = time.monotonic()
+    copied_now = 0
+    failed = []
+    for torrent_id, ok in _copy_rows(index, state["last_id"], batch_size, threads):
+        copied_now += 1
+        if not ok:
+            failed.append(torrent_id)
+
+        if copied_now % batch_size == 0:
+            # Results arrive in id order, so everything up to torrent_id is done
+            if failed:
+                r.sadd(REINDEX_FAILED_KEY, *failed)
+                failed = []
+            r.hset(REINDEX_STATE_KEY, mapping={"last_id": torrent_id, "copied": state["copied"] + copied_now})
+            _keep_paused()
+            elapsed = time.monotonic() - started
+            log(f"{state['copied'] + copied_now} document(s) copied, {copied_now / elapsed:.0f} docs/s")
+
+    if failed:
+        r.sadd(REINDEX_FAILED_KEY, *failed)
+
+    elapsed = time.monotonic() - started
+    log(f"Copied {copied_now} document(s) in {elapsed:.1f}s "
+        f"({copied_now / elapsed if elapsed else 0:.0f} docs/s)")
+
+    still_failing = _retry_failed(index, batch_size)
+    if still_failing:
+        raise ReindexError(
+            f"{still_failing} document(s) could not be indexed; run the command again to retry "
+            f"within {Config.SEARCH_OUTBOX_PAUSE_TTL}s (the search worker stays paused until then, "
+            f"or until the reindex completes or is aborted)"
+        )
+
+    _keep_paused()
+    finish_bulk_load(index)
+    previous = swap_alias(index)
+    log(f"Alias now points to {index}")
+    invalidate_search_cache()
+
+    r.delete(REINDEX_STATE_KEY, REINDEX_FAILED_KEY)
+    resume_outbox()
+
+    if not keep_old:
+        for name in previous:
+            es_client.indices.delete(index=name, ignore_unavailable=True)
+            log(f"Deleted old index {name}")
+
+    return index
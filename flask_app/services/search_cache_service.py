@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import time
+import redis
+from services.redis_service import r, register_script
+from config import Config
+
+# Cached /search responses are hashes {generation, body} under search:cache:<digest>.
+# Bumping the generation (invalidate_search_cache) makes every entry stale at
+# once; stale entries are overwritten by the next miss or expire with their TTL.
+GENERATION_KEY = "search:cache:generation"
+ENTRY_KEY = "search:cache:{}"
+LOCK_KEY = "search:cache:lock:{}"
+# hits, misses and coalesced (misses served by waiting for another worker's result)
+METRICS_KEY = "search:cache:metrics"
+
+# Reads the current generation and the entry in one round-trip, counting the hit
+# or miss. Returns {generation, body or nil}; entries of older generations are misses.
+LOOKUP_SCRIPT = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+local entry = redis.call('HMGET', KEYS[2], 'generation', 'body')
+local body = false
+if entry[1] == generation then
+    body = entry[2]
+end
+if body then
+    redis.call('HINCRBY', KEYS[3], 'hits', 1)
+else
+    redis.call('HINCRBY', KEYS[3], 'misses', 1)
+end
+return {generation, body}
+"""
+
+# Deletes the lock only if we still hold it (it may have expired and been taken over)
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_lookup_script = register_script(LOOKUP_SCRIPT)
+_release_script = register_script(RELEASE_SCRIPT)
+
+def search_cache_key(*parts) -> str:
+    """Digest of everything that determines a search response."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+def cached_search(digest: str, compute):
+    """
+    Return a search response body from the cache, computing it on a miss.
+
+    Only one web worker computes a missing entry (single flight): the others
+    wait up to SEARCH_CACHE_LOCK_WAIT for its result instead of all hitting
+    Elasticsearch when a popular entry expires. Redis errors never fail the
+    search, they only skip the cache.
+
+    Args:
+        digest (str): From search_cache_key
+        compute: Callable returning (body bytes, HTTP status); only 200s are cached
+
+    Returns:
+        (body bytes, HTTP status, whether it was served from the cache)
+    """
+    entry_key = ENTRY_KEY.format(digest)
+    try:
+        generation, body = _lookup_script(keys=[GENERATION_KEY, entry_key, METRICS_KEY])
+        if body is not None:
+            return body, 200, True
+
+        lock_key = LOCK_KEY.format(digest)
+        token = os.urandom(8).hex()
+        locked = r.set(lock_key, token, nx=True, px=int(Config.SEARCH_CACHE_LOCK_TIMEOUT * 1000))
+    except redis.RedisError as e:
+        print(f"Search cache unavailable: {e}")
+        return compute() + (False,)
+
+    if not locked:
+        deadline = time.monotonic() + Config.SEARCH_CACHE_LOCK_WAIT
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                entry_generation, body = r.hmget(entry_key, "generation", "body")
+                if entry_generation == generation and body is not None:
+                    r.hincrby(METRICS_KEY, "coalesced", 1)
+                    return body, 200, True
+        except redis.RedisError as e:
+            print(f"Search cache unavailable: {e}")
+        # The other worker is too slow (or failed); answer this request directly
+        return compute() + (False,)
+
+    try:
+        body, status = compute()
+        if status == 200:
+            try:
+                pipe = r.pipeline()
+                pipe.hset(entry_key, mapping={"generation": generation, "body": body})
+                pipe.expire(entry_key, Config.SEARCH_CACHE_TTL)
+                pipe.execute()
+            except redis.RedisError as e:
+                print(f"Search cache write failed: {e}")
+        return body, status, False
+    finally:
+        try:
+            _release_script(keys=[lock_key], args=[token])
+        except redis.RedisError as e:
+            print(f"Search cache lock release failed: {e}")
+
+def invalidate_search_cache():
+    """Make every cached search result stale (after the catalog changed)."""
+    try:
+        r.incr(GENERATION_KEY)
+        return True
+    except redis.RedisError as e:
+        print(f"Search cache invalidation failed: {e}")
+        return False
+
+def get_search_cache_metrics():
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(METRICS_KEY)
+    pipe.get(GENERATION_KEY)
+    counters, generation = pipe.execute()
+
+    metrics = {"hits": 0, "misses": 0, "coalesced": 0}
+    metrics.update({key.decode(): int(value) for key, value in counters.items()})
+    lookups = metrics["hits"] + metrics["misses"]
+    # Coalesced misses were answered from the cache too
+    metrics["hit_rate"] = round((metrics["hits"] + metrics["coalesced"]) / lookups, 4) if lookups else None
+    metrics["generation"] = int(generation or 0)
+    return metrics
@@ -0,0 +1,187 @@
+from datetime import datetime, timedelta
+import redis
+from sqlalchemy import select, delete, insert, text
+from models import Torrent, SearchOutbox, db
+from services.elastic_service import bulk_write, torrent_document, TORRENTS_ALIAS
+from services.redis_service import r
+from services.search_cache_service import invalidate_search_cache
+from config import Config
+
+OP_INDEX = "index"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+
+# Set while `flask reindex` copies the catalog; holds the index being built
+PAUSE_KEY = "search:outbox:paused"
+
+# Postgres advisory lock: drains hold it shared, pause_outbox takes it exclusively
+# to wait for drains that are already running
+DRAIN_LOCK_ID = 7355608
+
+# Columns needed to build a search document (never the pieces/info blobs)
+DOCUMENT_COLUMNS = (
+    Torrent.id, Torrent.info_hash, Torrent.filename, Torrent.description,
+    Torrent.file_size, Torrent.piece_length, Torrent.seeders, Torrent.leechers,
+    Torrent.completed, Torrent.uploader_id, Torrent.created_at, Torrent.updated_at
+)
+
+# The enqueue_* helpers only add to the current session: the caller commits them
+# together with the change they describe, so Postgres and the queue cannot disagree.
+
+def enqueue_index(torrent_ids):
+    """(Re)index torrents from their current row."""
+    _enqueue([{"torrent_id": torrent_id, "operation": OP_INDEX} for torrent_id in torrent_ids])
+
+def enqueue_delete(torrent_id):
+    _enqueue([{"torrent_id": torrent_id, "operation": OP_DELETE}])
+
+def enqueue_updates(partial_docs):
+    """
+    Partial document updates.
+
+    Args:
+        partial_docs (dict): torrent id -> fields to update
+    """
+    _enqueue([{"torrent_id": torrent_id, "operation": OP_UPDATE, "payload": doc}
+              for torrent_id, doc in partial_docs.items()])
+
+def _enqueue(rows):
+    if rows:
+        db.session.execute(insert(SearchOutbox), rows)
+
+def coalesce(entries):
+    """
+    Reduce queued operations to at most one action per torrent.
+
+    A delete wins over anything queued before it, an index (which re-reads the
+    row) absorbs partial updates, and consecutive partial updates are merged.
+
+    Args:
+        entries: SearchOutbox rows in queue order
+
+    Returns:
+        dict mapping torrent id to (operation, partial doc or None)
+    """
+    final = {}
+    for entry in entries:
+        operation, doc = final.get(entry.torrent_id, (None, None))
+
+        if entry.operation in (OP_DELETE, OP_INDEX):
+            final[entry.torrent_id] = (entry.operation, None)
+        elif operation == OP_DELETE:
+            # Updating a deleted document is a no-op
+            continue
+        elif operation == OP_INDEX:
+            continue
+        else:
+            merged = dict(doc or {})
+            merged.update(entry.payload or {})
+            final[entry.torrent_id] = (OP_UPDATE, merged)
+    return final
+
+def pause_outbox(reason: str):
+    """
+    Stop applying queued writes and wait until running drains have finished.
+
+    Writes keep accumulating in the outbox and are applied once resume_outbox
+    is called, so nothing that happens while paused is lost. The pause lapses
+    after SEARCH_OUTBOX_PAUSE_TTL seconds unless refresh_outbox_pause is called.
+    """
+    r.set(PAUSE_KEY, reason, ex=Config.SEARCH_OUTBOX_PAUSE_TTL)
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": DRAIN_LOCK_ID})
+    db.session.commit()
+
+def refresh_outbox_pause() -> bool:
+    """Keep a pause from lapsing for another SEARCH_OUTBOX_PAUSE_TTL seconds; False if it already has."""
+    return bool(r.expire(PAUSE_KEY, Config.SEARCH_OUTBOX_PAUSE_TTL))
+
+def resume_outbox():
+    r.delete(PAUSE_KEY)
+
+def outbox_paused():
+    """Reason the outbox is paused, or None."""
+    try:
+        reason = r.get(PAUSE_KEY)
+    except redis.RedisError as e:
+        print(f"Could not check the search outbox pause flag: {e}")
+        return None
+    return reason.decode() if reason else None
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(Config.SEARCH_OUTBOX_RETRY_BASE * 2 ** attempts, Config.SEARCH_OUTBOX_RETRY_MAX))
+
+def drain_outbox(batch_size: int = None):
+    """
+    Apply one batch of queued writes to Elasticsearch (nothing while paused).
+
+    Every pending entry of the selected torrents is taken together (rows are
+    locked with SKIP LOCKED, so several workers can run), coalesced and sent in
+    a single bulk request. Applied entries are deleted; entries of torrents whose
+    action failed stay queued with exponential backoff.
+
+    Returns:
+        (torrents applied, torrents failed)
+    """
+    batch_size = batch_size or Config.SEARCH_OUTBOX_BATCH_SIZE
+
+    db.session.execute(text("SELECT pg_advisory_xact_lock_shared(:id)"), {"id": DRAIN_LOCK_ID})
+    if outbox_paused():
+        db.session.commit()
+        return 0, 0
+
+    now = datetime.utcnow()
+
+    due = (
+        select(SearchOutbox.torrent_id)
+        .where(SearchOutbox.available_at <= now)
+        .order_by(SearchOutbox.id)
+        .limit(batch_size)
+    )
+    entries = db.session.scalars(
+        select(SearchOutbox)
+        .where(SearchOutbox.torrent_id.in_(due.scalar_subquery()))
+        .order_by(SearchOutbox.id)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    if not entries:
+        db.session.commit()
+        return 0, 0
+
+    final = coalesce(entries)
+
+    index_ids = [torrent_id for torrent_id, (operation, _) in final.items() if operation == OP_INDEX]
+    rows = {row.id: row for row in db.session.execute(
+        select(*DOCUMENT_COLUMNS).where(Torrent.id.in_(index_ids))
+    )} if index_ids else {}
+
+    actions = []
+    for torrent_id, (operation, doc) in final.items():
+        if operation == OP_INDEX and torrent_id in rows:
+            actions.append({"_op_type": "index", "_index": TORRENTS_ALIAS, "_id": torrent_id,
+                            "_source": torrent_document(rows[torrent_id])})
+        elif operation == OP_UPDATE:
+            actions.append({"_op_type": "update", "_index": TORRENTS_ALIAS, "_id": torrent_id, "doc": doc})
+        else:
+            # Deleted, or deleted again before it could be indexed
+            actions.append({"_op_type": "delete", "_index": TORRENTS_ALIAS, "_id": torrent_id})
+
+    failed = bulk_write(actions)
+
+    done = [entry.id for entry in entries if entry.torrent_id not in failed]
+    if done:
+        db.session.execute(delete(SearchOutbox).where(SearchOutbox.id.in_(done)))
+
+    retry_at = datetime.utcnow()
+    for entry in entries:
+        if entry.torrent_id in failed:
+            entry.attempts += 1
+            entry.available_at = retry_at + _backoff(entry.attempts)
+
+    db.session.commit()
+
+    # New or removed documents change search results; swarm count updates are
+    # left to the cache TTL so they do not flush it every sync
+    if any(operation != OP_UPDATE and torrent_id not in failed for torrent_id, (operation, _) in final.items()):
+        invalidate_search_cache()
+    return len(final) - len(failed), len(failed)
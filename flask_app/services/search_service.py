@@ -0,0 +1,238 @@
+import base64
+import binascii
+import json
+import re
+from datetime import datetime, timezone
+from sqlalchemy import func, or_, tuple_
+from models import Torrent, db
+from services.elastic_service import INFO_HASH_PATTERN
+
+SORT_OPTIONS = ("relevance", "seeders", "created_at", "size")
+ORDER_OPTIONS = ("desc", "asc")
+
+# Postgres has no relevance score; the fallback orders those searches by upload date
+PG_SORT_COLUMNS = {
+    "relevance": Torrent.created_at,
+    "seeders": Torrent.seeders,
+    "created_at": Torrent.created_at,
+    "size": Torrent.file_size
+}
+
+# Only what the search results contain; never the pieces/info/files blobs
+RESULT_COLUMNS = (
+    Torrent.id, Torrent.filename, Torrent.description, Torrent.info_hash, Torrent.file_size,
+    Torrent.seeders, Torrent.leechers, Torrent.completed, Torrent.created_at
+)
+
+# Hex queries too short for a full info hash ("deadbeef", "20240101") may be
+# words or the start of a hash, so they match either
+INFO_HASH_PREFIX_PATTERN = re.compile(r"[0-9a-fA-F]{8,39}")
+# Same word split as models.TORRENT_SEARCH_VECTOR
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# The fallback first fetches up to this many matching ids from the text index
+# (see search_postgres)
+TEXT_MATCH_PROBE = 1000
+
+# /search query parameter -> filter name, all optional
+INT_FILTERS = ("min_size", "max_size", "min_seeders")
+DATE_FILTERS = ("created_after", "created_before")
+
+class CursorError(ValueError):
+    """Raised for cursors that cannot be decoded or are no longer valid."""
+
+def _parse_date(value: str) -> datetime:
+    """ISO 8601 date or datetime as a naive UTC datetime (how created_at is stored)."""
+    # fromisoformat does not accept the "Z" suffix before Python 3.11
+    parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_search_params(args):
+    """
+    Validate the sort and filter query parameters of /search.
+
+    Returns:
+        (sort, order, filters) with filters holding only the given parameters,
+        dates as ISO strings so they fit in a cursor
+
+    Raises:
+        ValueError with a message for the client
+    """
+    sort = args.get("sort", "relevance")
+    if sort not in SORT_OPTIONS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_OPTIONS)}")
+
+    # Relevance is always best match first
+    order = "desc" if sort == "relevance" else args.get("order", "desc")
+    if order not in ORDER_OPTIONS:
+        raise ValueError("order must be asc or desc")
+
+    filters = {}
+    for name in INT_FILTERS:
+        if args.get(name):
+            try:
+                filters[name] = int(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an integer")
+    for name in DATE_FILTERS:
+        if args.get(name):
+            try:
+                filters[name] = _parse_date(args[name]).isoformat()
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO 8601 date")
+
+    return sort, order, filters
+
+def encode_cursor(state: dict) -> str:
+    """Opaque, URL-safe token for the next page; clients pass it back unchanged."""
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise CursorError("Invalid cursor")
+
+    if not isinstance(state, dict) or state.get("source") not in ("elasticsearch", "postgresql"):
+        raise CursorError("Invalid cursor")
+
+    # Cursors come back from clients, so they get the same checks as a first request
+    filters = state.get("filters")
+    if (not isinstance(state.get("q"), str) or state.get("sort") not in SORT_OPTIONS
+            or state.get("order") not in ORDER_OPTIONS or not isinstance(filters, dict)
+            or not set(filters) <= set(INT_FILTERS + DATE_FILTERS)
+            or not all(isinstance(value, (int, str)) and not isinstance(value, bool) for value in filters.values())):
+        raise CursorError("Invalid cursor")
+    try:
+        _, _, parsed = parse_search_params(dict({name: str(value) for name, value in filters.items()},
+                                                sort=state["sort"], order=state["order"]))
+    except ValueError:
+        raise CursorError("Invalid cursor")
+    if parsed != filters:
+        raise CursorError("Invalid cursor")
+
+    if state["source"] == "elasticsearch" and (not isinstance(state.get("pit_id"), str)
+                                               or not isinstance(state.get("after"), list)):
+        raise CursorError("Invalid cursor")
+    if state["source"] == "postgresql" and not _valid_pg_after(state.get("after"), state["sort"]):
+        raise CursorError("Invalid cursor")
+    return state
+
+def _valid_pg_after(after, sort: str) -> bool:
+    """Whether `after` is the [sort value, id] search_postgres returns for this sort."""
+    if not isinstance(after, list) or len(after) != 2:
+        return False
+    value, last_id = after
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        return False
+    if PG_SORT_COLUMNS[sort] is Torrent.created_at:
+        if not isinstance(value, str):
+            return False
+        try:
+            _parse_date(value)
+        except ValueError:
+            return False
+        return True
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def to_tsquery_terms(query: str):
+    """
+    Turn a search string into a tsquery matching documents that contain every
+    word of it, the last one as a prefix since it may still be typed
+    ("some.sho" finds "Some.Show"). Returns None if the query has no words.
+    """
+    words = [word.lower() for word in WORD_PATTERN.findall(query)]
+    if not words:
+        return None
+    return " & ".join(words[:-1] + [f"{words[-1]}:*"])
+
+def search_postgres(query: str, limit: int, sort: str = "relevance", order: str = "desc",
+                    filters: dict = None, after=None):
+    """
+    Full-text search with keyset pagination on (sort column, id).
+
+    Words are matched against the generated search_vector column (GIN index),
+    the last one by prefix; hex queries of 8+ characters also match info hash
+    prefixes, and a full info hash is an exact lookup (like build_search_query).
+    Only the returned columns are read.
+
+    Args:
+        after: [sort value, id] of the last row of the previous page
+
+    Returns:
+        (results, [sort value, id] to continue after, or None on the last page)
+    """
+    filters = filters or {}
+    column = PG_SORT_COLUMNS[sort]
+
+    torrents = db.session.query(*RESULT_COLUMNS)
+    if INFO_HASH_PATTERN.fullmatch(query):
+        torrents = torrents.filter(Torrent.info_hash == query.lower())
+    else:
+        terms = to_tsquery_terms(query)
+        if terms is None:
+            return [], None
+        match = Torrent.search_vector.op("@@")(func.to_tsquery("simple", terms))
+        if INFO_HASH_PREFIX_PATTERN.fullmatch(query):
+            match = or_(match, Torrent.info_hash.like(f"{query.lower()}%"))
+
+        # Postgres cannot estimate how many rows a tsquery matches and treats rare
+        # words like common ones, so it may walk the created_at index through the
+        # whole table looking for a handful of rows. Probing the GIN index first
+        # turns small match sets into a lookup by id; large ones keep the
+        # index-ordered plan, which finds a page quickly when matches are dense.
+        candidate_ids = [row.id for row in db.session.query(Torrent.id).filter(match).limit(TEXT_MATCH_PROBE)]
+        if len(candidate_ids) < TEXT_MATCH_PROBE:
+            torrents = torrents.filter(Torrent.id.in_(candidate_ids))
+        else:
+            torrents = torrents.filter(match)
+
+    if "min_size" in filters:
+        torrents = torrents.filter(Torrent.file_size >= filters["min_size"])
+    if "max_size" in filters:
+        torrents = torrents.filter(Torrent.file_size <= filters["max_size"])
+    if "min_seeders" in filters:
+        torrents = torrents.filter(Torrent.seeders >= filters["min_seeders"])
+    if "created_after" in filters:
+        torrents = torrents.filter(Torrent.created_at >= _parse_date(filters["created_after"]))
+    if "created_before" in filters:
+        torrents = torrents.filter(Torrent.created_at <= _parse_date(filters["created_before"]))
+
+    if after:
+        try:
+            value, last_id = after
+            if column is Torrent.created_at:
+                value = _parse_date(value)
+        except (TypeError, ValueError):
+            raise CursorError("Invalid cursor")
+        position, last = tuple_(column, Torrent.id), tuple_(value, last_id)
+        torrents = torrents.filter(position < last if order == "desc" else position > last)
+
+    if order == "desc":
+        torrents = torrents.order_by(column.desc(), Torrent.id.desc())
+    else:
+        torrents = torrents.order_by(column.asc(), Torrent.id.asc())
+
+    rows = torrents.limit(limit).all()
+
+    results = [{
+        "id": t.id,
+        "filename": t.filename,
+        "description": t.description,
+        "info_hash": t.info_hash,
+        "file_size": t.file_size,
+        "seeders": t.seeders,
+        "leechers": t.leechers,
+        "completed": t.completed,
+        "created_at": t.created_at.isoformat()
+    } for t in rows]
+
+    next_after = None
+    if len(rows) == limit:
+        value = getattr(rows[-1], column.key)
+        next_after = [value.isoformat() if isinstance(value, datetime) else value, rows[-1].id]
+    return results, next_after
@@ -0,0 +1,358 @@
+import redis
+import socket
+import struct
+import time
+from services.redis_service import r, register_script
+from config import Config
+
+# Every torrent's swarm lives in three Redis keys, all keyed by the raw 20-byte info_hash:
+#   swarm:<ih>:s  ZSET of seeders   member = peer_id + packed ip + port, score = last announce
+#   swarm:<ih>:l  ZSET of leechers  (same layout)
+#   swarm:<ih>:d  HASH with the "downloaded" (completed) counter
+# Postgres is never touched on the announce path; the Torrent.seeders/leechers/completed
+# columns are derived from these keys by the `flask sync-swarm` command.
+SWARM_PREFIX = b"swarm:"
+SEEDERS_SUFFIX = b":s"
+LEECHERS_SUFFIX = b":l"
+STATS_SUFFIX = b":d"
+
+# Info hashes whose counts changed since the last sync
+DIRTY_KEY = "swarm:dirty"
+
+# Counters describing how well the dirty set coalesces swarm changes (see record_sync)
+SYNC_METRICS_KEY = "swarm:sync_metrics"
+
+# Info hashes the tracker accepts announces for (kept in sync on upload/delete)
+REGISTRY_KEY = "tracker:registered"
+
+PEER_ID_LENGTH = 20
+
+EVENT_NONE = ""
+EVENT_STARTED = "started"
+EVENT_STOPPED = "stopped"
+EVENT_COMPLETED = "completed"
+EVENTS = (EVENT_NONE, EVENT_STARTED, EVENT_STOPPED, EVENT_COMPLETED)
+# BEP 3: "empty" is the same as not sending an event
+EVENT_EMPTY = "empty"
+
+# Prunes expired peers, moves the announcing peer into the right set and samples peers
+# for the reply, all in a single round-trip.
+# Returns {status, complete, incomplete, downloaded, peer...}; status 0 means unregistered.
+ANNOUNCE_SCRIPT = """
+local seeders, leechers, stats, registry, dirty, metrics = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6]
+local info_hash = ARGV[1]
+local member = ARGV[2]
+local now = tonumber(ARGV[3])
+local cutoff = tonumber(ARGV[4])
+local event = ARGV[5]
+local is_seed = ARGV[6] == '1'
+local numwant = tonumber(ARGV[7])
+local ttl = tonumber(ARGV[8])
+local check_registered = ARGV[9] == '1'
+
+if check_registered and redis.call('SISMEMBER', registry, info_hash) == 0 then
+    return {0}
+end
+
+local changed = redis.call('ZREMRANGEBYSCORE', seeders, '-inf', cutoff)
+changed = changed + redis.call('ZREMRANGEBYSCORE', leechers, '-inf', cutoff)
+
+if event == 'stopped' then
+    changed = changed + redis.call('ZREM', seeders, member) + redis.call('ZREM', leechers, member)
+else
+    local add_to, remove_from = leechers, seeders
+    if is_seed then
+        add_to, remove_from = seeders, leechers
+    end
+    changed = changed + redis.call('ZREM', remove_from, member)
+    changed = changed + redis.call('ZADD', add_to, now, member)
+end
+
+if event == 'completed' then
+    redis.call('HINCRBY', stats, 'downloaded', 1)
+    changed = changed + 1
+end
+
+local reply = {1, redis.call('ZCARD', seeders), redis.call('ZCARD', leechers),
+               tonumber(redis.call('HGET', stats, 'downloaded') or '0')}
+
+if numwant > 0 and event ~= 'stopped' then
+    -- Seeders have no use for other seeders
+    if not is_seed then
+        for _, peer in ipairs(redis.call('ZRANDMEMBER', seeders, numwant + 1)) do
+            table.insert(reply, peer)
+        end
+    end
+    for _, peer in ipairs(redis.call('ZRANDMEMBER', leechers, numwant + 1)) do
+        table.insert(reply, peer)
+    end
+end
+
+redis.call('EXPIRE', seeders, ttl)
+redis.call('EXPIRE', leechers, ttl)
+redis.call('EXPIRE', stats, ttl * 48)
+
+if changed > 0 then
+    redis.call('SADD', dirty, info_hash)
+    -- Every one of these would have been a database/search write without coalescing
+    redis.call('HINCRBY', metrics, 'pending_changes', 1)
+end
+
+return reply
+"""
+
+_announce_script = register_script(ANNOUNCE_SCRIPT)
+
+class AnnounceError(Exception):
+    """Raised for announces the tracker refuses; the message is sent as the failure reason."""
+
+def _swarm_keys(info_hash: bytes):
+    base = SWARM_PREFIX + info_hash
+    return base + SEEDERS_SUFFIX, base + LEECHERS_SUFFIX, base + STATS_SUFFIX
+
+def pack_peer(peer_id: bytes, ip: str, port: int) -> bytes:
+    """Build the swarm member for a peer: peer_id followed by its compact address."""
+    if ":" in ip:
+        packed_ip = socket.inet_pton(socket.AF_INET6, ip)
+    else:
+        packed_ip = socket.inet_aton(ip)
+    return peer_id + packed_ip + struct.pack("!H", port)
+
+def unpack_peer(member: bytes):
+    """Inverse of pack_peer. Returns (peer_id, ip, port)."""
+    peer_id, address = member[:PEER_ID_LENGTH], member[PEER_ID_LENGTH:]
+    if len(address) == 18:
+        ip = socket.inet_ntop(socket.AF_INET6, address[:16])
+    else:
+        ip = socket.inet_ntoa(address[:4])
+    return peer_id, ip, struct.unpack("!H", address[-2:])[0]
+
+def prepare_announce(info_hash: bytes, peer_id: bytes, ip: str, port: int, left: int,
+                     event: str = EVENT_NONE, numwant: int = None):
+    """
+    Validate an announce and build the ANNOUNCE_SCRIPT call for it.
+
+    Shared by the HTTP announce and the UDP tracker, which runs the script
+    through its own (asyncio) Redis client.
+
+    Returns:
+        (keys, args, member, numwant)
+    """
+    if len(info_hash) != 20:
+        raise AnnounceError("invalid info_hash")
+    if len(peer_id) != PEER_ID_LENGTH:
+        raise AnnounceError("invalid peer_id")
+    if not 0 < port < 65536:
+        raise AnnounceError("invalid port")
+    if event == EVENT_EMPTY:
+        event = EVENT_NONE
+    if event not in EVENTS:
+        raise AnnounceError("invalid event")
+
+    if numwant is None or numwant < 0:
+        numwant = Config.TRACKER_DEFAULT_NUMWANT
+    numwant = min(numwant, Config.TRACKER_MAX_NUMWANT)
+
+    try:
+        member = pack_peer(peer_id, ip, port)
+    except (OSError, ValueError):
+        raise AnnounceError("invalid ip")
+
+    now = time.time()
+    seeders_key, leechers_key, stats_key = _swarm_keys(info_hash)
+
+    keys = [seeders_key, leechers_key, stats_key, REGISTRY_KEY, DIRTY_KEY, SYNC_METRICS_KEY]
+    args = [
+        info_hash,
+        member,
+        now,
+        now - Config.TRACKER_PEER_TTL,
+        event,
+        1 if left == 0 else 0,
+        numwant,
+        Config.TRACKER_PEER_TTL,
+        0 if Config.TRACKER_ALLOW_UNREGISTERED else 1
+    ]
+    return keys, args, member, numwant
+
+def parse_announce_reply(reply, member: bytes, numwant: int):
+    """Turn the ANNOUNCE_SCRIPT reply into the dict returned by announce_peer."""
+    if reply[0] == 0:
+        raise AnnounceError("unregistered torrent")
+
+    peers = []
+    peers6 = []
+    peer_list = []
+    for peer in reply[4:]:
+        if len(peer_list) >= numwant:
+            break
+        if peer == member:
+            continue
+        address = peer[PEER_ID_LENGTH:]
+        if len(address) == 18:
+            peers6.append(address)
+        else:
+            peers.append(address)
+        peer_list.append(unpack_peer(peer))
+
+    return {
+        "complete": reply[1],
+        "incomplete": reply[2],
+        "downloaded": reply[3],
+        "peers": b"".join(peers),
+        "peers6": b"".join(peers6),
+        "peer_list": peer_list
+    }
+
+def announce_peer(info_hash: bytes, peer_id: bytes, ip: str, port: int, left: int,
+                  event: str = EVENT_NONE, numwant: int = None):
+    """
+    Record an announce in the swarm store and pick peers for the reply.
+
+    Args:
+        info_hash (bytes): Raw 20-byte info hash
+        peer_id (bytes): Raw 20-byte peer id
+        ip (str): Peer address (IPv4 or IPv6)
+        port (int): Peer port
+        left (int): Bytes the peer still has to download (0 means seeder)
+        event (str): One of EVENTS
+        numwant (int): Number of peers requested, capped at TRACKER_MAX_NUMWANT
+
+    Returns:
+        dict with complete/incomplete/downloaded counts and the compact
+        "peers" (IPv4, BEP 23) and "peers6" (IPv6, BEP 7) strings, plus
+        "peer_list" as (peer_id, ip, port) tuples for non-compact replies.
+    """
+    keys, args, member, numwant = prepare_announce(info_hash, peer_id, ip, port, left, event, numwant)
+    reply = _announce_script(keys=keys, args=args)
+    return parse_announce_reply(reply, member, numwant)
+
+def queue_swarm_counts(pipe, info_hashes, registered_only: bool = False):
+    """
+    Queue the commands get_swarm_counts needs on `pipe` (sync or asyncio pipeline).
+
+    Returns:
+        Whether a registry check was queued (pass it on to parse_swarm_counts)
+    """
+    check_registered = registered_only and not Config.TRACKER_ALLOW_UNREGISTERED
+
+    cutoff = time.time() - Config.TRACKER_PEER_TTL
+    if check_registered:
+        pipe.smismember(REGISTRY_KEY, info_hashes)
+    for info_hash in info_hashes:
+        seeders_key, leechers_key, stats_key = _swarm_keys(info_hash)
+        pipe.zcount(seeders_key, cutoff, "+inf")
+        pipe.zcount(leechers_key, cutoff, "+inf")
+        pipe.hget(stats_key, "downloaded")
+    return check_registered
+
+def parse_swarm_counts(info_hashes, results, check_registered: bool):
+    registered = results.pop(0) if check_registered else [True] * len(info_hashes)
+
+    counts = {}
+    for i, info_hash in enumerate(info_hashes):
+        if not registered[i]:
+            continue
+        complete, incomplete, downloaded = results[i * 3:i * 3 + 3]
+        counts[info_hash] = (complete, incomplete, int(downloaded or 0))
+    return counts
+
+def get_swarm_counts(info_hashes, registered_only: bool = False):
+    """
+    Read the live counts for many torrents in a single pipelined round-trip.
+
+    Args:
+        info_hashes (list[bytes]): Raw 20-byte info hashes
+        registered_only (bool): Leave out info hashes the tracker does not accept
+            announces for (ignored when TRACKER_ALLOW_UNREGISTERED is set)
+
+    Returns:
+        dict mapping info_hash to (complete, incomplete, downloaded)
+    """
+    if not info_hashes:
+        return {}
+
+    pipe = r.pipeline(transaction=False)
+    check_registered = queue_swarm_counts(pipe, info_hashes, registered_only)
+    return parse_swarm_counts(info_hashes, pipe.execute(), check_registered)
+
+def pop_dirty_info_hashes(count: int = 1000):
+    """Take up to `count` info hashes whose swarm changed since the last sync."""
+    return r.spop(DIRTY_KEY, count) or []
+
+def mark_dirty(info_hashes):
+    if info_hashes:
+        r.sadd(DIRTY_KEY, *info_hashes)
+
+def start_sync():
+    """
+    Snapshot the buffer at the start of a sync.
+
+    Returns:
+        (torrents waiting in the dirty set, swarm changes recorded since the last sync)
+    """
+    pipe = r.pipeline(transaction=True)
+    pipe.scard(DIRTY_KEY)
+    pipe.hget(SYNC_METRICS_KEY, "pending_changes")
+    pipe.hset(SYNC_METRICS_KEY, "pending_changes", 0)
+    buffered, changes, _ = pipe.execute()
+    return buffered, int(changes or 0)
+
+def record_sync(buffered: int, changes: int, updated: int, unchanged: int, seconds: float):
+    """
+    Store the outcome of a sync run.
+
+    updates_saved counts the per-announce writes that coalescing avoided:
+    swarm changes seen by the tracker minus the rows actually written.
+    """
+    try:
+        pipe = r.pipeline(transaction=True)
+        pipe.hset(SYNC_METRICS_KEY, mapping={
+            "buffer_size": buffered,
+            "last_flush_seconds": round(seconds, 4),
+            "last_flush_at": int(time.time()),
+            "last_updated": updated,
+            "last_unchanged": unchanged
+        })
+        pipe.hincrby(SYNC_METRICS_KEY, "flushes", 1)
+        pipe.hincrby(SYNC_METRICS_KEY, "updates_written", updated)
+        pipe.hincrby(SYNC_METRICS_KEY, "updates_skipped_unchanged", unchanged)
+        pipe.hincrby(SYNC_METRICS_KEY, "updates_saved", max(changes - updated, 0))
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Failed to record swarm sync metrics: {e}")
+
+def get_sync_metrics():
+    """Sync counters plus the current size of the dirty set."""
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(SYNC_METRICS_KEY)
+    pipe.scard(DIRTY_KEY)
+    metrics, dirty = pipe.execute()
+
+    result = {key.decode(): float(value) if b"." in value else int(value) for key, value in metrics.items()}
+    result["dirty_torrents"] = dirty
+    return result
+
+def register_torrents(info_hashes):
+    """Allow announces for the given raw info hashes."""
+    if not info_hashes:
+        return True
+    try:
+        r.sadd(REGISTRY_KEY, *info_hashes)
+        return True
+    except redis.RedisError as e:
+        print(f"Failed to register {len(info_hashes)} torrent(s) with the tracker: {e}")
+        return False
+
+def unregister_torrent(info_hash: bytes):
+    """Stop tracking a torrent and drop its swarm."""
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.srem(REGISTRY_KEY, info_hash)
+        pipe.srem(DIRTY_KEY, info_hash)
+        pipe.delete(*_swarm_keys(info_hash))
+        pipe.execute()
+        return True
+    except redis.RedisError as e:
+        print(f"Failed to unregister torrent {info_hash.hex()} from the tracker: {e}")
+        return False
@@ -0,0 +1,208 @@
+import bencodepy
+import hashlib
+import redis
+from sqlalchemy import select
+from models import Torrent, db
+from services.redis_service import r
+from config import Config
+
+# Hash with the ETag, download filename and body of a served .torrent file
+TORRENT_FILE_KEY = "torrent_file:{}"
+
+# Columns a download reads. The file list and piece hashes are only needed to
+# rebuild the info dict of rows uploaded before info_bytes existed.
+DOWNLOAD_COLUMNS = (Torrent.filename, Torrent.created_at, Torrent.info_bytes)
+REBUILD_COLUMNS = (Torrent.filename, Torrent.piece_length, Torrent.pieces, Torrent.files, Torrent.file_size)
+
+def _skip_value(data: bytes, i: int) -> int:
+    """Return the offset just past the bencoded value starting at data[i]."""
+    c = data[i:i + 1]
+    if c == b"i":
+        return data.index(b"e", i) + 1
+    if c in (b"l", b"d"):
+        i += 1
+        while data[i:i + 1] != b"e":
+            if i >= len(data):
+                raise ValueError("truncated bencoded data")
+            i = _skip_value(data, i)
+        return i + 1
+    if c.isdigit():
+        colon = data.index(b":", i)
+        end = colon + 1 + int(data[i:colon])
+        if end > len(data):
+            raise ValueError("truncated bencoded data")
+        return end
+    raise ValueError(f"invalid bencoded data at offset {i}")
+
+def extract_info_bytes(data: bytes) -> bytes:
+    """
+    Return the bencoded info dict exactly as it appears in a .torrent file.
+
+    Re-encoding a decoded info dict is not guaranteed to reproduce the original
+    bytes (key order, unknown keys), and the info_hash is defined over the
+    original bytes, so the slice is cut out of the file instead.
+    """
+    if data[:1] != b"d":
+        raise ValueError("torrent file is not a bencoded dictionary")
+
+    i = 1
+    while data[i:i + 1] != b"e":
+        key_end = _skip_value(data, i)
+        colon = data.index(b":", i)
+        key = data[colon + 1:key_end]
+        value_end = _skip_value(data, key_end)
+        if key == b"info":
+            return data[key_end:value_end]
+        i = value_end
+
+    raise ValueError("torrent file has no info dictionary")
+
+def parse_torrent_file(raw: bytes) -> dict:
+    """
+    Parse a .torrent file into Torrent column values.
+
+    Returns:
+        dict with info_hash, filename, file_size, piece_length, pieces,
+        pieces_count, files and info_bytes
+
+    Raises:
+        ValueError if the file is not a valid torrent
+    """
+    try:
+        torrent_data = bencodepy.decode(raw)
+
+        # Extract info_hash from the original info bytes (re-encoding may not round-trip)
+        info_bytes = extract_info_bytes(raw)
+        info_hash = hashlib.sha1(info_bytes).hexdigest()
+
+        # Extract torrent information
+        info = torrent_data[b'info']
+        filename = info[b'name'].decode('utf-8')
+        piece_length = info[b'piece length']
+        pieces = info[b'pieces']  # Raw bytes of concatenated SHA-1 hashes
+
+        # Calculate total file size
+        file_size = 0
+        files_list = []
+
+        if b'files' in info:
+            # Multi-file torrent
+            for file_info in info[b'files']:
+                file_path = '/'.join([p.decode('utf-8') for p in file_info[b'path']])
+                file_length = file_info[b'length']
+                file_size += file_length
+                files_list.append({
+                    "path": file_path,
+                    "length": file_length
+                })
+        else:
+            # Single-file torrent
+            file_size = info[b'length']
+    except (bencodepy.DecodingError, KeyError, TypeError, AttributeError, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed torrent ({type(e).__name__}: {e})")
+
+    if not isinstance(pieces, bytes) or len(pieces) % 20 != 0:
+        raise ValueError("pieces is not a multiple of 20 bytes")
+
+    return {
+        "info_hash": info_hash,
+        "filename": filename,
+        "file_size": file_size,
+        "piece_length": piece_length,
+        "pieces": pieces,
+        "pieces_count": len(pieces) // 20,
+        "files": files_list or None,
+        "info_bytes": info_bytes
+    }
+
+def build_info_bytes(torrent) -> bytes:
+    """Rebuild the info dict from the Torrent columns, or a row of REBUILD_COLUMNS (rows uploaded before info_bytes existed)."""
+    info = {
+        b'name': torrent.filename.encode('utf-8'),
+        b'piece length': torrent.piece_length,
+        b'pieces': torrent.pieces
+    }
+
+    if torrent.files:
+        # Multi-file torrent
+        info[b'files'] = [{
+            b'path': [p.encode('utf-8') for p in file_info.get('path', '').split('/')],
+            b'length': file_info.get('length', 0)
+        } for file_info in torrent.files]
+    else:
+        # Single-file torrent
+        info[b'length'] = torrent.file_size
+
+    return bencodepy.encode(info)
+
+def build_torrent_file(info_bytes: bytes, creation_date: int) -> bytes:
+    """
+    Splice already-encoded info bytes into a .torrent envelope.
+
+    Bencoded dict keys are sorted and "info" sorts after every other key we
+    write, so the envelope is the encoded metadata with the info appended.
+    """
+    envelope = bencodepy.encode({
+        b'announce': Config.TRACKER_ANNOUNCE_URL.encode('utf-8'),
+        b'creation date': creation_date,
+        b'created by': b'torrent-tracker'
+    })
+    return envelope[:-1] + b'4:info' + info_bytes + b'e'
+
+def load_torrent_file(torrent_id):
+    """
+    Build the .torrent file of a torrent from Postgres.
+
+    Returns:
+        (download filename, body), or None if the torrent does not exist
+    """
+    row = db.session.execute(select(*DOWNLOAD_COLUMNS).where(Torrent.id == torrent_id)).first()
+    if row is None:
+        return None
+
+    info_bytes = row.info_bytes
+    if info_bytes is None:
+        info_bytes = build_info_bytes(db.session.execute(select(*REBUILD_COLUMNS).where(Torrent.id == torrent_id)).one())
+    return f"{row.filename}.torrent", build_torrent_file(info_bytes, int(row.created_at.timestamp()))
+
+def make_etag(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+def get_cached_torrent_file_meta(torrent_id):
+    """Return (etag, filename) of a cached .torrent file, or None. Never reads the body."""
+    try:
+        etag, filename = r.hmget(TORRENT_FILE_KEY.format(torrent_id), "etag", "filename")
+    except redis.RedisError as e:
+        print(f"Torrent file cache read failed for {torrent_id}: {e}")
+        return None
+
+    if etag is None or filename is None:
+        return None
+    return etag.decode(), filename.decode('utf-8')
+
+def get_cached_torrent_file_body(torrent_id):
+    try:
+        return r.hget(TORRENT_FILE_KEY.format(torrent_id), "body")
+    except redis.RedisError as e:
+        print(f"Torrent file cache read failed for {torrent_id}: {e}")
+        return None
+
+def cache_torrent_file(torrent_id, etag: str, filename: str, body: bytes):
+    key = TORRENT_FILE_KEY.format(torrent_id)
+    try:
+        pipe = r.pipeline(transaction=True)
+        pipe.hset(key, mapping={"etag": etag, "filename": filename, "body": body})
+        pipe.expire(key, Config.TORRENT_FILE_CACHE_TTL)
+        pipe.execute()
+        return True
+    except redis.RedisError as e:
+        print(f"Torrent file cache write failed for {torrent_id}: {e}")
+        return False
+
+def invalidate_torrent_file(torrent_id):
+    try:
+        r.delete(TORRENT_FILE_KEY.format(torrent_id))
+        return True
+    except redis.RedisError as e:
+        print(f"Torrent file cache invalidation failed for {torrent_id}: {e}")
+        return False
@@ -0,0 +1,125 @@
+import redis
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import Torrent, User, db
+from services.redis_service import r, register_script
+from config import Config
+
+# Columns of GET /torrents/<id>: the scalar fields and the file list, never the
+# piece hashes or info bytes. Torrent has no uploader relationship, so the
+# uploader's name comes from an outer join (None when the user row is missing).
+DETAIL_COLUMNS = (
+    Torrent.id, Torrent.filename, Torrent.description, Torrent.info_hash, Torrent.file_size,
+    Torrent.piece_length, Torrent.pieces_count, Torrent.files, Torrent.seeders, Torrent.leechers,
+    Torrent.completed, User.username.label("uploader"), Torrent.created_at, Torrent.updated_at
+)
+
+# Hash with the version (updated_at in microseconds), ETag and body of a
+# serialized GET /torrents/<id> response. Invalidation leaves the new version
+# behind without a body and writes never go back to an older version, so a
+# request that read the row before a change cannot cache it after the change.
+TORRENT_DETAILS_KEY = "torrent_details:{}"
+# Left behind by a delete: nothing read before it is cached again
+DELETED_VERSION = 2 ** 62
+# Seconds a body-less version outlives its invalidation; only requests already
+# in flight at that moment can try to write an older one
+TOMBSTONE_TTL = 60
+
+STORE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'etag', ARGV[2], 'body', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+INVALIDATE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    local current = redis.call('HGET', key, 'version')
+    if not current or tonumber(current) < tonumber(ARGV[1]) then
+        redis.call('DEL', key)
+        redis.call('HSET', key, 'version', ARGV[1])
+        redis.call('EXPIRE', key, ARGV[2])
+    end
+end
+return #KEYS
+"""
+
+_store_script = register_script(STORE_SCRIPT)
+_invalidate_script = register_script(INVALIDATE_SCRIPT)
+
+def details_version(updated_at: datetime) -> int:
+    """Version of a torrent row: its updated_at in microseconds (0 if unset)."""
+    if updated_at is None:
+        return 0
+    return (updated_at - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+def fetch_torrent_details(torrent_id):
+    """
+    Read one torrent for its details page as a plain row, without building an ORM object.
+
+    Returns:
+        (dict of DETAIL_COLUMNS, row version), or None if the torrent does not exist
+    """
+    row = db.session.execute(
+        select(*DETAIL_COLUMNS)
+        .outerjoin(User, User.id == Torrent.uploader_id)
+        .where(Torrent.id == torrent_id)
+    ).first()
+    if row is None:
+        return None
+
+    details = row._asdict()
+    details["created_at"] = row.created_at.isoformat()
+    details["updated_at"] = row.updated_at.isoformat() if row.updated_at else None
+    return details, details_version(row.updated_at)
+
+def get_cached_torrent_details_etag(torrent_id):
+    """Return the ETag of a cached details response, or None. Never reads the body."""
+    try:
+        etag = r.hget(TORRENT_DETAILS_KEY.format(torrent_id), "etag")
+    except redis.RedisError as e:
+        print(f"Torrent details cache read failed for {torrent_id}: {e}")
+        return None
+    return etag.decode() if etag is not None else None
+
+def get_cached_torrent_details(torrent_id):
+    """Return (etag, body) of a cached details response, or None."""
+    try:
+        etag, body = r.hmget(TORRENT_DETAILS_KEY.format(torrent_id), "etag", "body")
+    except redis.RedisError as e:
+        print(f"Torrent details cache read failed for {torrent_id}: {e}")
+        return None
+
+    if etag is None or body is None:
+        return None
+    return etag.decode(), body
+
+def cache_torrent_details(torrent_id, version: int, etag: str, body: bytes):
+    """Store a details response, unless the cache already holds a newer version."""
+    try:
+        return bool(_store_script(keys=[TORRENT_DETAILS_KEY.format(torrent_id)],
+                                  args=[version, etag, body, Config.TORRENT_DETAILS_CACHE_TTL]))
+    except redis.RedisError as e:
+        print(f"Torrent details cache write failed for {torrent_id}: {e}")
+        return False
+
+def invalidate_torrent_details(torrent_ids, version: int):
+    """
+    Drop the cached details of torrents that changed (or were deleted), after the
+    change is committed.
+
+    Args:
+        version: Version of the rows after the change (DELETED_VERSION for deletes)
+    """
+    if not torrent_ids:
+        return True
+    try:
+        _invalidate_script(keys=[TORRENT_DETAILS_KEY.format(torrent_id) for torrent_id in torrent_ids],
+                           args=[version, TOMBSTONE_TTL])
+        return True
+    except redis.RedisError as e:
+        print(f"Torrent details cache invalidation failed for {len(torrent_ids)} torrent(s): {e}")
+        return False
@@ -0,0 +1,183 @@
+"""
+UDP tracker (BEP 15).
+
+Runs as its own process next to the Flask app and shares its configuration
+and swarm store (services/swarm_service.py), so peers announcing over UDP
+and HTTP end up in the same swarms.
+
+    python udp_tracker.py
+"""
+import asyncio
+import hashlib
+import struct
+import time
+import redis
+import redis.asyncio as aioredis
+from config import Config
+from services.swarm_service import (
+    ANNOUNCE_SCRIPT, AnnounceError, prepare_announce, parse_announce_reply,
+    queue_swarm_counts, parse_swarm_counts,
+    EVENT_NONE, EVENT_COMPLETED, EVENT_STARTED, EVENT_STOPPED
+)
+
+PROTOCOL_ID = 0x41727101980
+
+ACTION_CONNECT = 0
+ACTION_ANNOUNCE = 1
+ACTION_SCRAPE = 2
+ACTION_ERROR = 3
+
+UDP_EVENTS = {0: EVENT_NONE, 1: EVENT_COMPLETED, 2: EVENT_STARTED, 3: EVENT_STOPPED}
+
+CONNECT_REQUEST = struct.Struct("!QII")
+CONNECT_RESPONSE = struct.Struct("!IIQ")
+# connection_id, action, transaction_id, info_hash, peer_id, downloaded, left, uploaded,
+# event, ip, key, num_want, port
+ANNOUNCE_REQUEST = struct.Struct("!QII20s20sQQQIIIiH")
+ANNOUNCE_RESPONSE = struct.Struct("!IIIII")
+SCRAPE_HEADER = struct.Struct("!QII")
+SCRAPE_ENTRY = struct.Struct("!III")
+HEADER = struct.Struct("!II")
+
+# Per BEP 15 a connection id may be used for up to two minutes after it was handed out
+CONNECTION_ID_WINDOW = 60
+
+# A scrape reply must fit in a single datagram
+MAX_SCRAPE_HASHES = 74
+
+def connection_id_for(host: str, port: int, window: int) -> int:
+    """Connection ids are a keyed hash of the client address, so every replica can validate them."""
+    digest = hashlib.blake2b(
+        f"{host}:{port}:{window}".encode(),
+        key=Config.UDP_TRACKER_SECRET.encode(),
+        digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big")
+
+def is_valid_connection_id(connection_id: int, host: str, port: int) -> bool:
+    window = int(time.time()) // CONNECTION_ID_WINDOW
+    return connection_id in (
+        connection_id_for(host, port, window),
+        connection_id_for(host, port, window - 1)
+    )
+
+class UDPTrackerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.announce_script = redis_client.register_script(ANNOUNCE_SCRIPT)
+        self.transport = None
+        # Handlers in flight; the event loop only keeps weak references to tasks
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 16:
+            return
+        task = asyncio.ensure_future(self.handle(data, addr))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, data, addr):
+        host, port = addr[0], addr[1]
+        action, transaction_id = HEADER.unpack_from(data, 8)
+
+        try:
+            if action == ACTION_CONNECT:
+                response = self.connect(data, host, port)
+            else:
+                connection_id = struct.unpack_from("!Q", data)[0]
+                if not is_valid_connection_id(connection_id, host, port):
+                    raise AnnounceError("invalid connection id")
+
+                if action == ACTION_ANNOUNCE:
+                    response = await self.announce(data, host)
+                elif action == ACTION_SCRAPE:
+                    response = await self.scrape(data)
+                else:
+                    raise AnnounceError("unknown action")
+        except AnnounceError as e:
+            response = HEADER.pack(ACTION_ERROR, transaction_id) + str(e).encode("utf-8")
+        except struct.error:
+            response = HEADER.pack(ACTION_ERROR, transaction_id) + b"malformed request"
+        except redis.RedisError:
+            response = HEADER.pack(ACTION_ERROR, transaction_id) + b"tracker temporarily unavailable"
+        except Exception as e:
+            print(f"UDP tracker failed to handle action {action} from {host}:{port}: {e!r}")
+            response = HEADER.pack(ACTION_ERROR, transaction_id) + b"internal error"
+
+        if response is not None:
+            self.transport.sendto(response, addr)
+
+    def connect(self, data, host, port):
+        protocol_id, action, transaction_id = CONNECT_REQUEST.unpack_from(data)
+        if protocol_id != PROTOCOL_ID:
+            return None
+
+        window = int(time.time()) // CONNECTION_ID_WINDOW
+        return CONNECT_RESPONSE.pack(ACTION_CONNECT, transaction_id, connection_id_for(host, port, window))
+
+    async def announce(self, data, host):
+        if len(data) < ANNOUNCE_REQUEST.size:
+            raise AnnounceError("malformed announce")
+
+        (_, _, transaction_id, info_hash, peer_id, _, left, _,
+         event, _, _, num_want, port) = ANNOUNCE_REQUEST.unpack_from(data)
+
+        if event not in UDP_EVENTS:
+            raise AnnounceError("invalid event")
+
+        # The ip field is ignored; peers are always recorded with their source address
+        keys, args, member, numwant = prepare_announce(
+            info_hash, peer_id, host, port, left, UDP_EVENTS[event], num_want
+        )
+        reply = await self.announce_script(keys=keys, args=args)
+        swarm = parse_announce_reply(reply, member, numwant)
+
+        peers = swarm["peers6"] if ":" in host else swarm["peers"]
+        return ANNOUNCE_RESPONSE.pack(
+            ACTION_ANNOUNCE,
+            transaction_id,
+            Config.TRACKER_ANNOUNCE_INTERVAL,
+            swarm["incomplete"],
+            swarm["complete"]
+        ) + peers
+
+    async def scrape(self, data):
+        _, _, transaction_id = SCRAPE_HEADER.unpack_from(data)
+        payload = data[SCRAPE_HEADER.size:]
+        info_hashes = [payload[i:i + 20] for i in range(0, len(payload) - 19, 20)][:MAX_SCRAPE_HASHES]
+
+        if not info_hashes:
+            raise AnnounceError("info_hash is required")
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            check_registered = queue_swarm_counts(pipe, info_hashes, registered_only=True)
+            counts = parse_swarm_counts(info_hashes, await pipe.execute(), check_registered)
+
+        response = [HEADER.pack(ACTION_SCRAPE, transaction_id)]
+        for info_hash in info_hashes:
+            # Unknown torrents are reported as empty, the reply must keep the request order
+            complete, incomplete, downloaded = counts.get(info_hash, (0, 0, 0))
+            response.append(SCRAPE_ENTRY.pack(complete, downloaded, incomplete))
+        return b"".join(response)
+
+async def serve(host: str = Config.UDP_TRACKER_HOST, port: int = Config.UDP_TRACKER_PORT):
+    loop = asyncio.get_running_loop()
+    redis_client = aioredis.from_url(Config.REDIS_URL)
+
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: UDPTrackerProtocol(redis_client),
+        local_addr=(host, port)
+    )
+    print(f"UDP tracker listening on {host}:{port}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+        await redis_client.close()
+
+if __name__ == "__main__":
+    asyncio.run(serve())
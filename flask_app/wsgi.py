@@ -0,0 +1,4 @@
+from app import create_app
+
+# Entry point for gunicorn (see gunicorn.conf.py); `python app.py` is the dev server
+app = create_app()
@@ -0,0 +1,120 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+# Redis cost of the rate limiter algorithms: round-trips and commands per
+# check, memory per limited client and check latency, next to the old
+# ZSET pipeline. Every client sends --requests requests against a limit of
+# --limit per --window seconds, so a client's state is as large as it gets.
+# Use a Redis instance nothing else uses: the benchmark flushes its keys
+# and reads INFO commandstats.
+#
+# The second part measures how many checks the local tier (LocalRateLimiter)
+# still sends to Redis, with requests spread round-robin over --processes
+# simulated web processes, for clients well under and far over their limit.
+#
+#   python rate_limit_benchmark.py --redis-url redis://localhost:6379/15 --clients 2000 --limit 100
+
+def legacy_check(r, client, limit, window):
+    # What rate_limit ran before the Lua script
+    key = f"bench_legacy:{client}"
+    now = time.time()
+    pipe = r.pipeline()
+    pipe.zremrangebyscore(key, 0, now - window)
+    pipe.zadd(key, {f"{now}:{uuid.uuid4()}": now})
+    pipe.zcard(key)
+    pipe.expire(key, window + 1)
+    return pipe.execute()[2] <= limit, key
+
+def command_calls(r):
+    return sum(stats["calls"] for stats in r.info("commandstats").values())
+
+def run(r, name, check, clients, requests, limit, window):
+    r.flushdb()
+    calls_before = command_calls(r)
+    latencies = []
+    keys = set()
+    allowed = 0
+    for client in range(clients):
+        for _ in range(requests):
+            started = time.perf_counter()
+            ok, key = check(f"10.0.{client // 256}.{client % 256}", limit, window)
+            latencies.append((time.perf_counter() - started) * 1000)
+            allowed += ok
+            keys.add(key)
+    # The INFO call itself is counted once
+    commands = command_calls(r) - calls_before - 1
+
+    memory = [r.memory_usage(key) or 0 for key in keys]
+    latencies.sort()
+    total = clients * requests
+    print(f"{name:<17}{commands / total:>12.2f}{statistics.mean(memory):>14.0f}"
+          f"{statistics.median(latencies):>10.3f}{latencies[int(len(latencies) * 0.99) - 1]:>10.3f}"
+          f"{allowed / total:>10.1%}")
+
+def run_local(r, LocalRateLimiter, algorithm, processes, clients, requests, limit, window, share, sync_interval):
+    r.flushdb()
+    limiters = [LocalRateLimiter(clients, share, sync_interval) for _ in range(processes)]
+    allowed = 0
+    started = time.perf_counter()
+    for i in range(clients * requests):
+        client = i % clients
+        allowed += limiters[i % processes].check("bench", f"10.0.{client // 256}.{client % 256}",
+                                                 limit, window, algorithm)[0]
+    elapsed = time.perf_counter() - started
+
+    total = clients * requests
+    redis_checks = sum(limiter.stats["redis_checks"] for limiter in limiters)
+    return redis_checks / total, allowed / clients, total / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=None, help="Per client; defaults to 1.5x the limit.")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--processes", type=int, default=3, help="Web processes simulated for the local tier.")
+    parser.add_argument("--share", type=float, default=None, help="Local tier share, Config.RATE_LIMIT_LOCAL_SHARE by default.")
+    args = parser.parse_args()
+    requests = args.requests or int(args.limit * 1.5)
+
+    os.environ["REDIS_URL"] = args.redis_url
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "flask_app"))
+    from config import Config
+    from services.redis_service import r, check_rate_limit, LocalRateLimiter, RATE_LIMIT_ALGORITHMS
+
+    def algorithm_check(algorithm):
+        def check(client, limit, window):
+            allowed = check_rate_limit("bench", client, limit, window, algorithm)[0]
+            return allowed, f"rate_limit:{algorithm}:bench:{client}"
+        return check
+
+    print(f"{args.clients} clients x {requests} requests, limit {args.limit}/{args.window}s\n")
+    print(f"{'algorithm':<17}{'cmds/check':>12}{'bytes/client':>14}{'p50 ms':>10}{'p99 ms':>10}{'allowed':>10}")
+    run(r, "legacy pipeline", lambda client, limit, window: legacy_check(r, client, limit, window),
+        args.clients, requests, args.limit, args.window)
+    for algorithm in RATE_LIMIT_ALGORITHMS:
+        run(r, algorithm, algorithm_check(algorithm), args.clients, requests, args.limit, args.window)
+
+    share = Config.RATE_LIMIT_LOCAL_SHARE if args.share is None else args.share
+    print(f"\nLocal tier, {args.processes} processes, share {share}, requests round-robin over the processes")
+    print(f"{'algorithm':<17}{'traffic':<22}{'redis/request':>14}{'allowed/client':>16}{'checks/s':>10}")
+    traffic = (("well under limit", max(args.limit // 2, 1)), ("5x over limit", args.limit * 5))
+    for algorithm in RATE_LIMIT_ALGORITHMS:
+        for name, per_client in traffic:
+            redis_share, allowed, rate = run_local(
+                r, LocalRateLimiter, algorithm, args.processes, args.clients, per_client,
+                args.limit, args.window, share, Config.RATE_LIMIT_LOCAL_SYNC_INTERVAL
+            )
+            print(f"{algorithm:<17}{name:<22}{redis_share:>14.2f}{allowed:>16.1f}{rate:>10.0f}")
+    r.flushdb()
+
+    print("\nThe legacy pipeline is 1 round-trip with 4 commands (plus MULTI/EXEC); every script check is "
+          "1 EVALSHA round-trip, cmds/check includes the commands the script runs.")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
+import argparse
+import statistics
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from flask_app.config import Config
 
 BASE_URL = "http://localhost:5000"
 
+# Requests per window allowed by @rate_limit() on "/"
+DEFAULT_LIMIT = 10
+
 def login(username: str, password: str):
     login_payload = {
         "username": username,
@@ -29,11 +36,89 @@ def login(username: str, password: str):
         print(f"ERROR: Connection failed - {e}")
         return
 
+def simulated_client(client: int, requests_per_client: int, token: str = None):
+    """
+    Send requests as one simulated client, identified by the X-Forwarded-For
+    entry a proxy would add. Returns [(status code, latency in ms)].
+    """
+    session = requests.Session()
+    headers = {"X-Forwarded-For": f"10.77.{client // 250}.{client % 250 + 1}"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    results = []
+    for _ in range(requests_per_client):
+        started = time.perf_counter()
+        resp = session.get(f"{BASE_URL}/", headers=headers)
+        results.append((resp.status_code, (time.perf_counter() - started) * 1000))
+    return results
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)] if values else 0
+
+def test_client_isolation(clients: int, limit: int, concurrency: int):
+    """
+    Every simulated client sends limit + 2 requests at once. Each must get
+    exactly `limit` 200s: fewer means clients share a bucket (everyone counted
+    as the proxy), more means the limit is not enforced.
+    """
+    print(f"\n--- {clients} clients x {limit + 2} requests to / ---")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        per_client = list(pool.map(lambda client: simulated_client(client, limit + 2), range(clients)))
+    elapsed = time.perf_counter() - started
+
+    allowed = [sum(1 for status, _ in results if status == 200) for results in per_client]
+    wrong = [client for client, count in enumerate(allowed) if count != limit]
+    if wrong:
+        print(f"FAIL: {len(wrong)} client(s) did not get exactly {limit} requests through "
+              f"(got {sorted(set(allowed[client] for client in wrong))})")
+    else:
+        print(f"PASS: every client got exactly {limit} requests through, then 429")
+
+    accepted = [latency for results in per_client for status, latency in results if status == 200]
+    rejected = [latency for results in per_client for status, latency in results if status == 429]
+    total = sum(len(results) for results in per_client)
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    print(f"Accepted p50 {statistics.median(accepted):.1f} ms, p99 {percentile(accepted, 0.99):.1f} ms")
+    if rejected:
+        # A rejection runs only the limiter, so this is its cost plus the HTTP round-trip
+        print(f"Rejected p50 {statistics.median(rejected):.1f} ms, p99 {percentile(rejected, 0.99):.1f} ms")
+    return not wrong
+
+def test_user_keying(token: str, limit: int):
+    """With RATE_LIMIT_BY_USER=1, one user coming from many addresses has one limit."""
+    print("\n--- one user from many addresses ---")
+    statuses = [simulated_client(1000 + i, 1, token)[0][0] for i in range(limit + 2)]
+    if statuses.count(200) == limit:
+        print(f"PASS: the user got {limit} requests through across {limit + 2} addresses")
+        return True
+    print(f"FAIL: {statuses.count(200)} of {limit + 2} requests got through (is RATE_LIMIT_BY_USER=1 set?)")
+    return False
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=(
+        "Rate limiter checks. Run against an app started with TRUSTED_PROXY_COUNT=1 and "
+        "reached directly (this script plays the proxy), with a fresh limiter state."
+    ))
+    parser.add_argument("--url", default=BASE_URL)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--by-user", action="store_true", help="Also check keying by user (RATE_LIMIT_BY_USER=1).")
+    args = parser.parse_args()
+    BASE_URL = args.url
+
     token = login("theadministrator", "admin")
 
     if token:
         for i in range(12):
             resp = requests.get(f"{BASE_URL}/")
             print(f"Status code: {resp.status_code}")
-            print(f"Response: {resp.text}")
\ No newline at end of file
+            print(f"Response: {resp.text}")
+
+        passed = test_client_isolation(args.clients, args.limit, args.concurrency)
+        if args.by_user:
+            passed = test_user_keying(token, args.limit) and passed
+        print("\nAll checks passed" if passed else "\nSome checks failed")
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import os
+import random
+import struct
+import time
+from flask_app.config import Config
+
+# Load generator for udp_tracker.py: keeps a fixed number of announces in flight
+# from a single process and reports announces/sec.
+#
+# Pin the tracker to one core to get a per-core figure, e.g.
+#   taskset -c 0 python flask_app/udp_tracker.py
+#   taskset -c 1 python udp_tracker_load_test.py --info-hash <hex>
+#
+# The info hashes must be registered with the tracker (uploaded, or
+# `flask register-torrents`), unless it runs with TRACKER_ALLOW_UNREGISTERED=1.
+
+PROTOCOL_ID = 0x41727101980
+
+class LoadClient(asyncio.DatagramProtocol):
+    def __init__(self, info_hashes, concurrency, duration):
+        self.info_hashes = info_hashes
+        self.concurrency = concurrency
+        self.duration = duration
+        self.transport = None
+        self.connection_id = None
+        self.connected = asyncio.get_event_loop().create_future()
+        self.done = asyncio.get_event_loop().create_future()
+        self.pending = {}
+        self.latencies = []
+        self.announces = 0
+        self.errors = 0
+        self.deadline = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.send_connect()
+
+    def send_connect(self):
+        self.transport.sendto(struct.pack("!QII", PROTOCOL_ID, 0, random.getrandbits(32)))
+
+    def send_announce(self):
+        transaction_id = random.getrandbits(32)
+        packet = struct.pack(
+            "!QII20s20sQQQIIIiH",
+            self.connection_id, 1, transaction_id,
+            random.choice(self.info_hashes), os.urandom(20),
+            0, random.choice((0, 1 << 30)), 0,
+            random.choice((0, 2)), 0, 0, 50, random.randint(1024, 65535)
+        )
+        self.pending[transaction_id] = time.perf_counter()
+        self.transport.sendto(packet)
+
+    def datagram_received(self, data, addr):
+        action, transaction_id = struct.unpack_from("!II", data)
+
+        if action == 0:
+            self.connection_id = struct.unpack_from("!Q", data, 8)[0]
+            if not self.connected.done():
+                self.connected.set_result(True)
+            return
+
+        sent = self.pending.pop(transaction_id, None)
+        if sent is None:
+            return
+
+        if action == 1:
+            self.announces += 1
+            self.latencies.append(time.perf_counter() - sent)
+        else:
+            self.errors += 1
+            if self.errors == 1:
+                print(f"Tracker error: {data[8:].decode('utf-8', 'replace')}")
+
+        if time.perf_counter() < self.deadline:
+            self.send_announce()
+        elif not self.pending and not self.done.done():
+            self.done.set_result(True)
+
+async def run(host, port, info_hashes, concurrency, duration):
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(
+        lambda: LoadClient(info_hashes, concurrency, duration),
+        remote_addr=(host, port)
+    )
+
+    try:
+        await asyncio.wait_for(client.connected, timeout=5)
+    except asyncio.TimeoutError:
+        print(f"ERROR: No connect response from {host}:{port}")
+        transport.close()
+        return
+
+    client.deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    for _ in range(concurrency):
+        client.send_announce()
+
+    try:
+        # Replies for datagrams lost in flight never arrive; don't wait for them forever
+        await asyncio.wait_for(client.done, timeout=duration + 5)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+    transport.close()
+
+    latencies = sorted(client.latencies)
+    print(f"Announces: {client.announces} in {elapsed:.2f}s ({client.announces / elapsed:,.0f} announces/sec)")
+    print(f"Errors: {client.errors}, unanswered: {len(client.pending)}")
+    if latencies:
+        print(f"Latency p50: {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+              f"p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP tracker announce load generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=Config.UDP_TRACKER_PORT)
+    parser.add_argument("--info-hash", action="append", default=[],
+                        help="Hex info hash to announce for (repeatable, default: 100 random ones)")
+    parser.add_argument("--concurrency", type=int, default=256, help="Announces kept in flight")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    args = parser.parse_args()
+
+    info_hashes = [bytes.fromhex(h) for h in args.info_hash] or [os.urandom(20) for _ in range(100)]
+    asyncio.run(run(args.host, args.port, info_hashes, args.concurrency, args.duration))
@@ -0,0 +1,150 @@
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import requests
+
+# Throughput and latency of the web app under concurrent load: req/s and
+# p50/p99 for /search and /torrents/<id>.
+#
+# Against a running deployment:
+#   python web_benchmark.py --url http://localhost:5000 --username theadministrator --password admin
+#
+# Or start gunicorn locally in each serving mode and compare them (needs the
+# app's Postgres/Redis/Elasticsearch/Keycloak reachable via the usual env vars):
+#   python web_benchmark.py --modes gthread gevent --username theadministrator --password admin
+#
+# The benchmark client is exempted from the rate limit for the duration of the
+# run (a `flask rate-limit` override on the clients it is seen as), so the
+# numbers are the cost of serving, not of rejecting.
+
+FLASK_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flask_app")
+
+SEARCH_QUERIES = ["expanse", "night watch", "planet s02", "harb", "1080p"]
+
+def start_server(mode, port):
+    env = dict(os.environ, GUNICORN_MODE=mode, PORT=str(port))
+    process = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"], cwd=FLASK_APP_DIR, env=env,
+                               start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn ({mode}) exited with {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    stop_server(process)
+    sys.exit(f"gunicorn ({mode}) did not start within 60s")
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait(timeout=30)
+
+def login(url, username, password):
+    resp = requests.post(f"{url}/auth/login", json={"username": username, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+def load(url, paths, headers, concurrency, duration):
+    """Request `paths` round-robin from `concurrency` threads for `duration` seconds."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(offset):
+        session = requests.Session()
+        mine, codes = [], {}
+        i = offset
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            resp = session.get(url + paths[i % len(paths)], headers=headers)
+            mine.append((time.perf_counter() - started) * 1000)
+            codes[resp.status_code] = codes.get(resp.status_code, 0) + 1
+            i += 1
+        with lock:
+            latencies.extend(mine)
+            for code, count in codes.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p99": latencies[max(int(len(latencies) * 0.99) - 1, 0)] if latencies else 0,
+        "statuses": statuses
+    }
+
+def run(url, token, torrent_ids, args):
+    headers = {"Authorization": f"Bearer {token}"}
+    scenarios = {
+        "/search": [f"/search?q={query}&limit=20" for query in SEARCH_QUERIES],
+        "/torrents/<id>": [f"/torrents/{torrent_id}" for torrent_id in torrent_ids]
+    }
+    results = {}
+    for name, paths in scenarios.items():
+        # Warm pools and caches first
+        load(url, paths, headers, args.concurrency, min(2, args.duration))
+        results[name] = load(url, paths, headers, args.concurrency, args.duration)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:5000", help="Running app (ignored with --modes).")
+    parser.add_argument("--modes", nargs="*", choices=["gthread", "gevent"],
+                        help="Start gunicorn locally in each mode instead of using --url.")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario.")
+    parser.add_argument("--torrent-ids", type=int, nargs="*", default=list(range(1, 21)))
+    parser.add_argument("--client-ip", default=None,
+                        help="Address the app sees this client as (default: 127.0.0.1 with --modes).")
+    args = parser.parse_args()
+
+    sys.path.insert(0, FLASK_APP_DIR)
+    from services.redis_service import set_rate_limit_override, remove_rate_limit_override
+
+    targets = [(mode, f"http://127.0.0.1:{args.port}") for mode in args.modes] if args.modes else [(None, args.url)]
+    client_ip = args.client_ip or "127.0.0.1"
+    for bucket in ("default", "suggest"):
+        set_rate_limit_override(bucket, 10 ** 9, 60, client=client_ip)
+
+    report = []
+    try:
+        for mode, url in targets:
+            process = start_server(mode, args.port) if mode else None
+            try:
+                token = login(url, args.username, args.password)
+                report.append((mode or url, run(url, token, args.torrent_ids, args)))
+            finally:
+                if process:
+                    stop_server(process)
+    finally:
+        for bucket in ("default", "suggest"):
+            remove_rate_limit_override(bucket, client=client_ip)
+
+    print(f"\n{args.concurrency} concurrent clients, {args.duration:.0f}s per scenario")
+    print(f"{'server':<24}{'endpoint':<18}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}  statuses")
+    for server, results in report:
+        for endpoint, result in results.items():
+            print(f"{server:<24}{endpoint:<18}{result['rps']:>10.0f}{result['p50']:>10.1f}{result['p99']:>10.1f}"
+                  f"  {result['statuses']}")
+
+if __name__ == "__main__":
+    main()